@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Benchmarks of the model entry points on the recordings shipped in data/.
+
+    Every benchmark runs in a forked process, which measures the wall time of
+    each repetition and the peak resident memory of the call (Linux reports
+    the peak of a forked process starting from its size at the fork, so the
+    memory of the setup, e.g. the analysis feeding a synthesis, is excluded
+    from rss_delta_kb).  Results are written as JSON lines, one per benchmark,
+    file and parameter set.
+
+    Run all benchmarks and store the results of the current commit:
+
+        python benchmarks/bench_models.py run -o results.jsonl
+
+    Compare two result files, exiting with status 1 on regressions:
+
+        python benchmarks/bench_models.py compare base.jsonl results.jsonl
+"""
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+import scipy
+from scipy.signal import get_window
+
+from eflute.audio_generation import fft, peak_detect, utils
+from eflute.sms_tools.models import (harmonicModel, hprModel, sineModel, spsModel, stft, stochasticModel,
+                                     utilFunctions)
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+DATA_FILES = sorted(glob.glob(os.path.join(DATA_DIR, "*.wav")) + glob.glob(os.path.join(DATA_DIR, "*", "*.wav")))
+GRID = {"N": [1024, 2048], "H": [128, 256], "window": ["hamming", "blackmanharris"]}
+QUICK_GRID = {"N": [2048], "H": [256], "window": ["blackmanharris"]}
+
+# analysis parameters that are not part of the grid
+T = -80  # threshold in negative dB
+NH = 40  # number of harmonics
+MINF0, MAXF0, F0ET = 100, 1500, 5  # f0 range of the flute and soprano notes and maximum f0 error
+STOCF = 0.2  # stochastic decimation factor
+
+
+def _sine_anal(x, fs, w, p):
+    return sineModel.sine_model_anal(x, fs, w, p["N"], p["H"], T)
+
+
+def _harmonic_anal(x, fs, w, p):
+    return harmonicModel.harmonic_model_anal(x, fs, w, p["N"], p["H"], T, NH, MINF0, MAXF0, F0ET)
+
+
+def _setup_none(x, fs, w, p):
+    return None
+
+
+def _setup_stft(x, fs, w, p):
+    return stft.stft_anal(x, w, p["N"], p["H"])
+
+
+def _setup_stochastic(x, fs, w, p):
+    return stochasticModel.stochastic_model_anal(x, p["H"], 2 * p["H"], STOCF)
+
+
+def _setup_dataframe(x, fs, w, p):
+    return utils.load_wav(p["file"])
+
+
+def _setup_fft(x, fs, w, p):
+    return fft.fft(utils.load_wav(p["file"]))
+
+
+# name: (setup, call, uses the N/H/window grid); setup(x, fs, w, params) runs before the fork and is not timed
+BENCHMARKS = {
+    "stft_anal": (_setup_none, lambda x, fs, w, p, s: stft.stft_anal(x, w, p["N"], p["H"]), True),
+    "stft_synth": (_setup_stft, lambda x, fs, w, p, s: stft.stft_synth(s[0], s[1], w.size, p["H"]), True),
+    "sine_model_anal": (_setup_none, lambda x, fs, w, p, s: _sine_anal(x, fs, w, p), True),
+    "sine_model_synth": (_sine_anal, lambda x, fs, w, p, s: sineModel.sine_model_synth(s[0], s[1], s[2], 512,
+                                                                                          p["H"], fs), True),
+    "f0_detection": (_setup_none, lambda x, fs, w, p, s: harmonicModel.f0_detection(x, fs, w, p["N"], p["H"], T,
+                                                                                    MINF0, MAXF0, F0ET), True),
+    "harmonic_model_anal": (_setup_none, lambda x, fs, w, p, s: _harmonic_anal(x, fs, w, p), True),
+    "stochastic_model_anal": (_setup_none, lambda x, fs, w, p, s: _setup_stochastic(x, fs, w, p), True),
+    "stochastic_model_synth": (_setup_stochastic, lambda x, fs, w, p, s: stochasticModel.stochastic_model_synth(
+        s, p["H"], 2 * p["H"]), True),
+    "hpr_model_anal": (_setup_none, lambda x, fs, w, p, s: hprModel.hpr_model_anal(
+        x, fs, w, p["N"], p["H"], T, 0.02, NH, MINF0, MAXF0, F0ET, 0.01), True),
+    "sps_model_anal": (_setup_none, lambda x, fs, w, p, s: spsModel.sps_model_anal(
+        x, fs, w, p["N"], p["H"], T, 0.02, 100, 20, 0.01, STOCF), True),
+    "heatmap": (_setup_dataframe, lambda x, fs, w, p, s: fft.heatmap(s), False),
+    "peak_detect": (_setup_fft, lambda x, fs, w, p, s: peak_detect.peak_detect(s, column="FFT_Power",
+                                                                               lookahead=50), False),
+}
+
+
+def _max_rss_kb():
+    """
+    Peak resident memory of the current process in kB
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _measure(queue, call, args, repeat):
+    """
+    Time a call in a freshly forked process and report its peak memory
+    """
+    start_rss = _max_rss_kb()
+    times = [timeit.default_timer()]
+    try:
+        for _ in range(repeat):
+            call(*args)
+            times.append(timeit.default_timer())
+    except Exception as e:  # report the failure to the parent, which would wait forever for the results
+        queue.put(("error", repr(e)))
+        return
+    peak_rss = _max_rss_kb()
+    queue.put((list(np.diff(times)), peak_rss, peak_rss - start_rss))
+
+
+def run_benchmark(name, filename, params, repeat=3):
+    """
+    Run one benchmark on one file
+    name: key of BENCHMARKS, filename: wav file, params: dict with N, H and window (or empty)
+    returns dict with the results, or with the error if the call raised
+    """
+    setup, call, _ = BENCHMARKS[name]
+    wav = utilFunctions.WavFile(filename)
+    x = wav.read(channel=0)  # analyze the first channel
+    p = dict(params, file=filename)
+    w = get_window(p["window"], p["N"] - 1) if "N" in p else None
+    state = setup(x, wav.fs, w, p)
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(queue, call, (x, wav.fs, w, p, state), repeat))
+    process.start()
+    measure = queue.get()
+    process.join()
+    if measure[0] == "error":
+        return {"benchmark": name, "file": os.path.relpath(filename, DATA_DIR), "params": params, "error": measure[1]}
+    times, peak_rss, rss_delta = measure
+    return {"benchmark": name,
+            "file": os.path.relpath(filename, DATA_DIR),
+            "params": params,
+            "samples": len(wav),
+            "times": times,
+            "best": min(times),
+            "median": float(np.median(times)),
+            "peak_rss_kb": peak_rss,
+            "rss_delta_kb": rss_delta}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=DATA_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args):
+    grid = QUICK_GRID if args.quick else GRID
+    params = [dict(zip(sorted(grid), values)) for values in itertools.product(*[grid[k] for k in sorted(grid)])]
+    files = args.files or (DATA_FILES[:1] if args.quick else DATA_FILES)
+    names = args.benchmarks or sorted(BENCHMARKS)
+    environment = {"commit": _commit(), "python": platform.python_version(), "numpy": np.__version__,
+                   "scipy": scipy.__version__, "machine": platform.machine(), "cpus": multiprocessing.cpu_count()}
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for name in names:
+            for filename in files:
+                for p in (params if BENCHMARKS[name][2] else [{}]):
+                    try:
+                        result = run_benchmark(name, filename, p, args.repeat)
+                    except Exception as e:  # record the failure and go on with the other benchmarks
+                        result = {"benchmark": name, "file": os.path.relpath(filename, DATA_DIR), "params": p,
+                                  "error": repr(e)}
+                    result.update(environment)
+                    output.write(json.dumps(result, sort_keys=True) + "\n")
+                    output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def _load(filename):
+    results = {}
+    with open(filename) as f:
+        for line in f:
+            r = json.loads(line)
+            if "error" not in r:
+                results[(r["benchmark"], r["file"], json.dumps(r["params"], sort_keys=True))] = r
+    return results
+
+
+def compare(args):
+    base, new = _load(args.base), _load(args.new)
+    regressions = 0
+    print("{:<24} {:<18} {:<48} {:>9} {:>9}".format("benchmark", "file", "params", "time", "memory"))
+    for key in sorted(set(base) & set(new)):
+        time_ratio = new[key]["best"] / base[key]["best"]
+        memory_ratio = (new[key]["rss_delta_kb"] + 1.0) / (base[key]["rss_delta_kb"] + 1.0)
+        regression = time_ratio > args.threshold or memory_ratio > args.threshold
+        regressions += regression
+        print("{:<24} {:<18} {:<48} {:>8.2f}x {:>8.2f}x{}".format(key[0], key[1], key[2], time_ratio, memory_ratio,
+                                                                 "  REGRESSION" if regression else ""))
+    print("{} regressions over {} common benchmarks".format(regressions, len(set(base) & set(new))))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the eflute models on the bundled recordings")
+    subparsers = parser.add_subparsers(dest="command")
+    parser_run = subparsers.add_parser("run", help="run benchmarks and write JSON lines")
+    parser_run.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser_run.add_argument("-b", "--benchmarks", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser_run.add_argument("-f", "--files", nargs="+", help="wav files (default: all files in data/)")
+    parser_run.add_argument("-r", "--repeat", type=int, default=3, help="repetitions of every call")
+    parser_run.add_argument("--quick", action="store_true", help="one file and one parameter set")
+    parser_compare = subparsers.add_parser("compare", help="compare two result files")
+    parser_compare.add_argument("base")
+    parser_compare.add_argument("new")
+    parser_compare.add_argument("-t", "--threshold", type=float, default=1.2,
+                                help="time or memory ratio reported as regression")
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Accuracy and speed of the coarse-to-fine f0 search (harmonicModel.f0_detection_multires) against
+    the full resolution detector (harmonicModel.f0_detection) on the recordings shipped in data/.
+
+    For every file, the f0 of f0_detection is the reference: the report gives the speedup, the part
+    of the frames where both agree on voicing, and on the frames voiced by both, the median and the
+    95th percentile of the deviation in cents and the part of gross errors (above 50 cents).
+
+        python benchmarks/f0_accuracy.py --maxf0 600 -N 4096 -M 2401
+"""
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+import numpy as np
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import harmonicModel, utilFunctions
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+DATA_FILES = sorted(glob.glob(os.path.join(DATA_DIR, "*.wav")) + glob.glob(os.path.join(DATA_DIR, "*", "*.wav")))
+
+T = -80  # threshold in negative dB
+F0ET = 5  # maximum f0 error
+GROSS_CENTS = 50  # deviation counted as gross error
+
+
+def _best_time(call, repeat):
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = call()
+        times.append(timeit.default_timer() - start)
+    return min(times), result
+
+
+def compare_file(filename, args):
+    """
+    Compare the two detectors on one file
+    returns dict with the times of both detectors and the accuracy of f0_detection_multires
+    """
+    wav = utilFunctions.WavFile(filename)
+    x = wav.read(channel=0)  # analyze the first channel
+    w = get_window(args.window, args.M)
+    time, f0 = _best_time(lambda: harmonicModel.f0_detection(x, wav.fs, w, args.N, args.H, T, args.minf0,
+                                                             args.maxf0, F0ET), args.repeat)
+    mtime, mf0 = _best_time(lambda: harmonicModel.f0_detection_multires(x, wav.fs, w, args.N, args.H, T, args.minf0,
+                                                                        args.maxf0, F0ET, args.decimation),
+                            args.repeat)
+    both = (f0 > 0) & (mf0 > 0)
+    cents = 1200 * np.abs(np.log2(mf0[both] / f0[both])) if both.any() else np.zeros(1)
+    return {"file": os.path.relpath(filename, DATA_DIR),
+            "time": time,
+            "multires_time": mtime,
+            "voicing": float(np.mean((f0 > 0) == (mf0 > 0))),
+            "median_cents": float(np.median(cents)),
+            "p95_cents": float(np.percentile(cents, 95)),
+            "gross": float(np.mean(cents > GROSS_CENTS))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coarse-to-fine f0 search against f0_detection")
+    parser.add_argument("-f", "--files", nargs="+", help="wav files (default: all files in data/)")
+    parser.add_argument("-N", type=int, default=4096, help="FFT size")
+    parser.add_argument("-M", type=int, default=2401, help="window size")
+    parser.add_argument("-H", type=int, default=256, help="hop size")
+    parser.add_argument("-w", "--window", default="blackman", help="window type")
+    parser.add_argument("--minf0", type=float, default=100, help="minimum f0 in Hz")
+    parser.add_argument("--maxf0", type=float, default=600, help="maximum f0 in Hz")
+    parser.add_argument("-d", "--decimation", type=int, help="decimation factor (default: f0_decimation)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="repetitions of every call")
+    args = parser.parse_args(argv)
+    print("decimation {}".format(args.decimation or harmonicModel.f0_decimation(44100, args.N, args.H, args.maxf0)))
+    print("{:<18} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}".format("file", "time", "speedup", "voicing", "median",
+                                                              "p95", "gross"))
+    results = [compare_file(filename, args) for filename in (args.files or DATA_FILES)]
+    for r in results:
+        print("{:<18} {:>8.3f} {:>7.2f}x {:>8.3f} {:>8.2f} {:>8.2f} {:>8.3f}".format(
+            r["file"], r["time"], r["time"] / r["multires_time"], r["voicing"], r["median_cents"], r["p95_cents"],
+            r["gross"]))
+    print("{:<18} {:>8.3f} {:>7.2f}x {:>8.3f} {:>8.2f} {:>8.2f} {:>8.3f}".format(
+        "all", sum(r["time"] for r in results),
+        sum(r["time"] for r in results) / sum(r["multires_time"] for r in results),
+        np.mean([r["voicing"] for r in results]), np.median([r["median_cents"] for r in results]),
+        np.median([r["p95_cents"] for r in results]), np.mean([r["gross"] for r in results])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,16 @@ def load_wav(file_name):
     return sound_data
 
 
+def open_wav(file_name):
+    """
+    Open a wav file without loading it: the samples are memory-mapped, read lazily as
+    normalized floats (by slicing or with chunks()), and sampling rate (fs) and number of
+    channels (nchannels) are attributes instead of columns.
+    """
+    from eflute.sms_tools.models.utilFunctions import WavFile
+    return WavFile(file_name)
+
+
 def setup_plots():
     import IPython
     IPython.core.getipython.get_ipython().magic(u'matplotlib inline')
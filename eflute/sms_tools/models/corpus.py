@@ -0,0 +1,129 @@
+# analysis of a corpus of sound files (e.g. one file per note) in a pool of processes
+#
+# Usage:
+#     params = {"N": 2048, "H": 256, "t": -80, "nH": 40, "minf0": 100, "maxf0": 1500, "f0et": 5}
+#     for r in corpus.run_corpus(["data/Flute", "data/Sopran"], "harmonic", w, params):
+#         if r["error"] is None:
+#             hfreq, hmag, hphase = r["result"]
+# Every worker sets up the model once (imports, window, a first analysis that allocates the buffers of the
+# spectra and peaks) and then analyzes the files it is given. The results are returned as soon as a file
+# is analyzed, not in the order of the files, and a file that fails to be analyzed only gives an error result.
+
+import glob
+import multiprocessing
+import os
+import timeit
+import traceback
+
+import numpy as np
+
+import harmonicModel
+import hprModel
+import hpsModel
+import sineModel
+import sprModel
+import spsModel
+import utilFunctions
+
+# name: analysis function, called as function(x, fs, w, **params)
+MODELS = {"sine": sineModel.sine_model_anal,
+          "f0": harmonicModel.f0_detection,
+          "harmonic": harmonicModel.harmonic_model_anal,
+          "hpr": hprModel.hpr_model_anal,
+          "hps": hpsModel.hps_model_anal,
+          "spr": sprModel.spr_model_anal,
+          "sps": spsModel.sps_model_anal}
+
+WARM_UP_SIZE = 4096  # samples of the sound analyzed by every worker before the files
+
+_state = None  # (analysis function, window, parameters, channel) of the worker process
+
+
+def corpus_files(paths, pattern="*.wav"):
+    """
+    Sound files of a corpus
+    paths: directories and files (or a single one), pattern: pattern of the files of the directories
+    returns list of file names, the files of every directory in sorted order
+    """
+
+    if isinstance(paths, basestring):
+        paths = [paths]
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, pattern))) if os.path.isdir(path) else [path]
+    return files
+
+
+def _warm_up(function, w, params, fs):
+    """
+    Run an analysis once on a short noise sound, which also raises the errors of its parameters
+    """
+
+    x = 1e-3 * np.random.RandomState(0).randn(max(WARM_UP_SIZE, 2 * w.size))
+    function(x, fs, w, **params)
+
+
+def _init_worker(model, w, params, channel, fs):
+    """
+    Set up the analysis of a worker process
+    """
+
+    global _state
+    _state = (MODELS[model], w, params, channel)
+    _warm_up(MODELS[model], w, params, fs)
+
+
+def _analyze_file(filename, state=None):
+    """
+    Analyze one file with the analysis of the worker (or with state, in the calling process)
+    returns dict with the file, its sampling rate and size, the analysis time and the result or the error
+    """
+
+    function, w, params, channel = state or _state
+    result = {"file": filename, "fs": None, "samples": None, "time": 0.0, "result": None, "error": None}
+    start = timeit.default_timer()
+    try:
+        wav = utilFunctions.WavFile(filename)
+        result["fs"], result["samples"] = wav.fs, len(wav)
+        result["result"] = function(wav.read(channel=channel), wav.fs, w, **params)
+    except Exception:  # report the error of the file and go on with the other files
+        result["error"] = traceback.format_exc()
+    result["time"] = timeit.default_timer() - start
+    return result
+
+
+def run_corpus(paths, model, w, params, processes=None, channel=0, fs=44100):
+    """
+    Analyze the sound files of a corpus with one of the models
+    paths: directories and files of the corpus (see corpus_files), model: key of MODELS, w: analysis window
+    params: other parameters of the analysis function, as keyword arguments (e.g. N, H, t)
+    processes: number of processes (default: number of cpus, 1: no pool), channel: channel of multichannel files
+    fs: sampling rate of the warm-up analysis
+    returns an iterator over the result of every file (see _analyze_file), in the order the analyses end
+    """
+
+    if model not in MODELS:
+        raise ValueError("Unknown model: {}".format(model))
+    _warm_up(MODELS[model], w, params, fs)  # raise errors of the parameters here rather than in the workers
+    files = corpus_files(paths)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or len(files) <= 1:  # serial analysis
+        state = (MODELS[model], w, params, channel)
+        return (_analyze_file(filename, state) for filename in files)
+    return _pool_results(files, processes, (model, w, params, channel, fs))
+
+
+def _pool_results(files, processes, initargs):
+    """
+    Analyze files in a pool of processes set up by _init_worker(*initargs)
+    returns an iterator over the results, in the order the analyses end
+    """
+
+    pool = multiprocessing.Pool(min(processes, len(files)), _init_worker, initargs)
+    try:
+        for result in pool.imap_unordered(_analyze_file, files):
+            yield result
+    finally:
+        pool.terminate()  # also stops the analyses if the results are not all consumed
+        pool.join()
@@ -4,16 +4,24 @@
 import math
 
 import numpy as np
+from scipy.signal import resample_poly
 
 import dftModel
 import sineModel
+import spectralAnalysis
+import stft
+import tracing
 import utilFunctions
 
+F0_BAND = 0.9  # part of the band of a decimated sound that is kept by the decimation filter
+F0_REFINE_BINS = 2  # bins of the full resolution spectrum searched at each side of a coarse f0
 
+
+@tracing.traced("f0_detection")
 def f0_detection(x, fs, w, N, H, t, minf0, maxf0, f0et):
     """
     Fundamental frequency detection of a sound using twm algorithm
-    x: input sound; fs: sampling rate; w: analysis window;
+    x: input sound (or spectralAnalysis.SpectralAnalysis of the sound); fs: sampling rate; w: analysis window;
     N: FFT size; t: threshold in negative dB,
     minf0: minimum f0 frequency in Hz, maxf0: maximim f0 frequency in Hz,
     f0et: error threshold in the f0 detection (ex: 5),
@@ -30,27 +38,111 @@ def f0_detection(x, fs, w, N, H, t, minf0, maxf0, f0et):
 
     hM1 = int(math.floor((w.size + 1) / 2))  # half analysis window size by rounding
     hM2 = int(math.floor(w.size / 2))  # half analysis window size by floor
-    x = np.append(np.zeros(hM2), x)  # add zeros at beginning to center first window at sample 0
-    x = np.append(x, np.zeros(hM1))  # add zeros at the end to analyze last sample
-    pin = hM1  # init sound pointer in middle of anal window
-    pend = x.size - hM1  # last sample to start a frame
-    w = w / sum(w)  # normalize analysis window
-    f0 = []  # initialize f0 output
-    f0stable = 0  # initialize f0 stable
-    while pin < pend:
-        x1 = x[pin - hM1:pin + hM2]  # select frame
-        mX, pX = dftModel.dft_anal(x1, w, N)  # compute dft
-        ploc = utilFunctions.peakDetection(mX, t)  # detect peak locations
-        iploc, ipmag, ipphase = utilFunctions.peakInterp(mX, pX, ploc)  # refine peak values
-        ipfreq = fs * iploc / N  # convert locations to Hez
-        f0t = utilFunctions.f0Twm(ipfreq, ipmag, f0et, minf0, maxf0, f0stable)  # find f0
-        if ((f0stable == 0) & (f0t > 0)) \
-                or ((f0stable > 0) & (np.abs(f0stable - f0t) < f0stable / 5.0)):
-            f0stable = f0t  # consider a stable f0 if it is close to the previous one
-        else:
-            f0stable = 0
-        f0 = np.append(f0, f0t)  # add f0 to output array
-        pin += H  # advance sound pointer
+    size = spectralAnalysis.signal(x).size + hM2 + hM1  # size of the sound with zeros to center the first window
+    nFrames = -(-(size - 2 * hM1) // H)  # frames whose center lies between hM1 and size-hM1 (excluded)
+    ipfreq, ipmag, ipphase, offsets = spectralAnalysis.peaks(x, fs, w, N, H, t, nFrames)  # peaks of all frames
+    tracer = tracing.active()  # stage functions are only wrapped if tracing is enabled
+    if tracer:
+        tracer.count("f0_detection", nFrames, ipfreq.size)
+    f0TwmFrames = tracing.timed(tracer, "f0Twm", utilFunctions.f0TwmFrames)
+    f0 = f0TwmFrames(ipfreq, ipmag, offsets, f0et, minf0, maxf0)  # find f0 of all frames
+    return f0
+
+
+def _f0_refine(xframes, f0c, w, N, fs):
+    """
+    Refine coarse f0 values with the full resolution spectrum of their frames, only computed around them
+    xframes: frames of the sound (one per row), f0c: coarse f0 of every frame (0 if unvoiced), w: analysis window,
+    N: FFT size, fs: sampling rate
+    returns f0: location of the spectral peak closest to every coarse f0 (the coarse f0 if there is no peak near it)
+    """
+
+    f0 = np.array(f0c, dtype=float)
+    voiced = np.flatnonzero(f0 > 0)  # frames to refine
+    B = F0_REFINE_BINS
+    k = np.round(f0[voiced] * N / fs).astype(int)  # bin of every coarse f0
+    mX = np.zeros((voiced.size, 2 * B + 1))
+    n = np.arange(w.size)
+    shift = (w / sum(w))[:, np.newaxis] * np.exp(-2j * np.pi * np.outer(n, np.arange(-B, B + 1)) / N)
+    for kc in np.unique(k):  # frames with the same bin share the DFT kernels of the 2B+1 bins around it
+        kernels = np.exp(-2j * np.pi * kc * n / N)[:, np.newaxis] * shift  # windowed kernels of bins kc-B..kc+B
+        kernels = np.hstack((kernels.real, kernels.imag))  # real and imaginary parts, to multiply real frames
+        group = np.flatnonzero(k == kc)
+        for b in range(0, group.size, stft.FRAME_BLOCK):  # refine the frames in blocks to bound temporary memory
+            g = group[b:b + stft.FRAME_BLOCK]
+            X = xframes[voiced[g]].dot(kernels)  # spectrum of the bins around kc
+            absX = np.hypot(X[:, :2 * B + 1], X[:, 2 * B + 1:])
+            absX[absX < dftModel.eps] = dftModel.eps  # if zeros add epsilon to handle log
+            mX[g] = 20 * np.log10(absX)
+    i = np.argmax(mX[:, 1:-1], axis=1) + 1  # strongest bin that has two neighbours
+    rows = np.arange(voiced.size)
+    val, lval, rval = mX[rows, i], mX[rows, i - 1], mX[rows, i + 1]
+    peak = (val > lval) & (val > rval)  # keep the coarse f0 if the band holds no peak
+    iploc = k[peak] + i[peak] - B + 0.5 * (lval - rval)[peak] / (lval - 2 * val + rval)[peak]  # center of parabola
+    f0[voiced[peak]] = fs * iploc / N
+    return f0
+
+
+def f0_decimation(fs, N, H, maxf0):
+    """
+    Largest decimation factor of the coarse f0 search of f0_detection_multires whose band keeps the harmonics
+    used by the TWM errors of every f0 candidate
+    fs: sampling rate, N: FFT size, H: hop size, maxf0: maximum f0 frequency in Hz
+    returns decimation: power of 2 dividing N and H (1: no decimation)
+    """
+
+    decimation = 1
+    while (N % (2 * decimation) == 0) and (H % (2 * decimation) == 0) \
+            and (utilFunctions.TWM_MAXNPEAKS * maxf0 < F0_BAND * fs / (4.0 * decimation)):
+        decimation *= 2
+    return decimation
+
+
+@tracing.traced("f0_detection_multires")
+def f0_detection_multires(x, fs, w, N, H, t, minf0, maxf0, f0et, decimation=None):
+    """
+    Fundamental frequency detection of a sound using twm algorithm on a decimated sound (with a smaller FFT and the
+    same window duration), refined with the full resolution spectrum in a narrow band around the coarse f0
+    x: input sound; fs: sampling rate; w: analysis window; N: FFT size; t: threshold in negative dB,
+    minf0: minimum f0 frequency in Hz, maxf0: maximim f0 frequency in Hz,
+    f0et: error threshold in the f0 detection (ex: 5),
+    decimation: decimation factor of the coarse search (default: f0_decimation, larger factors drop harmonics
+    of the high candidates and can make their errors bigger than those of the candidates of f0_detection)
+    returns f0: fundamental frequency, with the frames of f0_detection
+    """
+
+    if decimation is None:
+        decimation = f0_decimation(fs, N, H, maxf0)
+
+    if decimation == 1:  # no coarse search
+        return f0_detection(x, fs, w, N, H, t, minf0, maxf0, f0et)
+
+    if minf0 < 0:  # raise exception if minf0 is smaller than 0
+        raise ValueError("Minumum fundamental frequency (minf0) smaller than 0")
+
+    if maxf0 >= F0_BAND * fs / (2.0 * decimation):  # raise exception if maxf0 is not in the band of the decimated sound
+        raise ValueError("Maximum fundamental frequency (maxf0) outside the band of the decimated sound")
+
+    if H <= 0 or H % decimation != 0:  # raise error if the frames of the decimated sound are not the frames of x
+        raise ValueError("Hop size (H) not a positive multiple of the decimation factor")
+
+    if N % decimation != 0:  # raise error if the FFT of the decimated sound does not have the bins of the FFT of x
+        raise ValueError("FFT size (N) not a multiple of the decimation factor")
+
+    hM1 = int(math.floor((w.size + 1) / 2))  # half analysis window size by rounding
+    hM2 = int(math.floor(w.size / 2))  # half analysis window size by floor
+    nFrames = -(-(x.size + hM2 - hM1) // H)  # frames of f0_detection
+    tracer = tracing.active()  # stage functions are only wrapped if tracing is enabled
+    xd = tracing.timed(tracer, "decimation", resample_poly)(x, 1, decimation)  # sample i*decimation of x
+    wd = w[(w.size - 1) % decimation // 2::decimation]  # decimated window, centered on the center of w
+    xd = np.concatenate((xd, np.zeros(max(nFrames * H // decimation + wd.size - xd.size, 0))))  # for the last frame
+    ipfreq, ipmag, ipphase, offsets = spectralAnalysis.peaks(xd, fs / float(decimation), wd, N // decimation,
+                                                             H // decimation, t, nFrames)  # same bins as with N
+    if tracer:
+        tracer.count("f0_detection_multires", nFrames, ipfreq.size)
+    f0c = tracing.timed(tracer, "f0Twm", utilFunctions.f0TwmFrames)(ipfreq, ipmag, offsets, f0et, minf0, maxf0)
+    xframes = stft.frame_view(np.concatenate((np.zeros(hM2), x, np.zeros(hM1))), w.size, H, nFrames)
+    f0 = tracing.timed(tracer, "f0_refine", _f0_refine)(xframes, f0c, w, N, fs)  # full resolution around f0c
     return f0
 
 
@@ -71,26 +163,62 @@ def harmonic_detection(pfreq, pmag, pphase, f0, nH, hfreqp, fs, harmDevSlope=0.0
     hmag = np.zeros(nH) - 100  # initialize harmonic magnitudes
     hphase = np.zeros(nH)  # initialize harmonic phases
     hf = f0 * np.arange(1, nH + 1)  # initialize harmonic frequencies
-    hi = 0  # initialize harmonic index
-    if hfreqp == []:  # if no incomming harmonic tracks initialize to harmonic series
+    if len(hfreqp) == 0:  # if no incomming harmonic tracks initialize to harmonic series
         hfreqp = hf
-    while (f0 > 0) and (hi < nH) and (hf[hi] < fs / 2):  # find harmonic peaks
-        pei = np.argmin(abs(pfreq - hf[hi]))  # closest peak
-        dev1 = abs(pfreq[pei] - hf[hi])  # deviation from perfect harmonic
-        dev2 = (abs(pfreq[pei] - hfreqp[hi]) if hfreqp[hi] > 0 else fs)  # deviation from previous frame
-        threshold = f0 / 3 + harmDevSlope * pfreq[pei]
-        if ((dev1 < threshold) or (dev2 < threshold)):  # accept peak if deviation is small
-            hfreq[hi] = pfreq[pei]  # harmonic frequencies
-            hmag[hi] = pmag[pei]  # harmonic magnitudes
-            hphase[hi] = pphase[pei]  # harmonic phases
-        hi += 1  # increase harmonic index
+    hi = np.count_nonzero(hf < fs / 2)  # harmonics below Nyquist
+    if pfreq.size == 0:  # no peaks to take the harmonics from
+        return hfreq, hmag, hphase
+    pei = utilFunctions.nearestPeaks(pfreq, np.array([0, pfreq.size]), np.zeros(1, dtype=int), hf[np.newaxis, :hi])[0]
+    dev1 = abs(pfreq[pei] - hf[:hi])  # deviation from perfect harmonic
+    hfreqp = np.asarray(hfreqp[:hi])
+    dev2 = np.where(hfreqp > 0, abs(pfreq[pei] - hfreqp), fs)  # deviation from previous frame
+    threshold = f0 / 3 + harmDevSlope * pfreq[pei]
+    accept = (dev1 < threshold) | (dev2 < threshold)  # accept peaks if deviation is small
+    hfreq[:hi][accept] = pfreq[pei[accept]]  # harmonic frequencies
+    hmag[:hi][accept] = pmag[pei[accept]]  # harmonic magnitudes
+    hphase[:hi][accept] = pphase[pei[accept]]  # harmonic phases
+    return hfreq, hmag, hphase
+
+
+def harmonic_detection_frames(pfreq, pmag, pphase, offsets, f0, nH, fs, harmDevSlope=0.01):
+    """
+    Detection of the harmonics of consecutive frames, like harmonic_detection called frame after frame with the
+    harmonics of the previous frame (and none before the first frame)
+    pfreq, pmag, pphase: peak frequencies, magnitudes and phases of all frames, one after the other
+    offsets: peaks of frame l are at offsets[l]:offsets[l+1], f0: fundamental frequency of every frame
+    nH: number of harmonics, fs: sampling rate; harmDevSlope: slope of change of the deviation allowed to perfect harmonic
+    returns hfreq, hmag, hphase: harmonic frequencies, magnitudes and phases (one frame per row)
+    """
+
+    nFrames = f0.size
+    hf = np.multiply.outer(f0, np.arange(1, nH + 1))  # ideal harmonic series of every frame
+    valid = (f0[:, np.newaxis] > 0) & (hf < fs / 2) & (np.diff(offsets)[:, np.newaxis] > 0)
+    pei = utilFunctions.nearestPeaks(pfreq, offsets, np.arange(nFrames), hf)[valid]  # closest peaks
+    pf = np.zeros((nFrames, nH))
+    pf[valid] = pfreq[pei]
+    threshold = f0[:, np.newaxis] / 3 + harmDevSlope * pf
+    close = valid & (abs(pf - hf) < threshold)  # small deviation from perfect harmonic
+    follow = np.zeros((nFrames, nH), dtype=bool)  # small deviation from the peak of the previous frame
+    follow[1:] = valid[1:] & valid[:-1] & (abs(pf[1:] - pf[:-1]) < threshold[1:])
+    # a peak is accepted if it is close to the perfect harmonic, or if it follows an accepted peak
+    l = np.arange(nFrames)[:, np.newaxis]
+    lastClose = np.maximum.accumulate(np.where(close, l, -1), axis=0)  # last frame with a close peak
+    lastBreak = np.maximum.accumulate(np.where(follow, -1, l), axis=0)  # last frame not following the previous one
+    accept = lastClose >= lastBreak
+    hfreq = np.where(accept, pf, 0)  # harmonic frequencies
+    hmag = np.zeros((nFrames, nH))  # harmonic magnitudes
+    hmag[f0 > 0] = -100
+    hmag[accept] = pmag[pei[accept[valid]]]
+    hphase = np.zeros((nFrames, nH))  # harmonic phases
+    hphase[accept] = pphase[pei[accept[valid]]]
     return hfreq, hmag, hphase
 
 
+@tracing.traced("harmonic_model_anal")
 def harmonic_model_anal(x, fs, w, N, H, t, nH, minf0, maxf0, f0et, harmDevSlope=0.01, minSineDur=.02):
     """
     Analysis of a sound using the sinusoidal harmonic model
-    x: input sound; fs: sampling rate, w: analysis window; N: FFT size (minimum 512); t: threshold in negative dB,
+    x: input sound (or spectralAnalysis.SpectralAnalysis of the sound); fs: sampling rate, w: analysis window; N: FFT size (minimum 512); t: threshold in negative dB,
     nH: maximum number of harmonics;  minf0: minimum f0 frequency in Hz,
     maxf0: maximim f0 frequency in Hz; f0et: error threshold in the f0 detection (ex: 5),
     harmDevSlope: slope of harmonic deviation; minSineDur: minimum length of harmonics
@@ -102,36 +230,16 @@ def harmonic_model_anal(x, fs, w, N, H, t, nH, minf0, maxf0, f0et, harmDevSlope=
 
     hM1 = int(math.floor((w.size + 1) / 2))  # half analysis window size by rounding
     hM2 = int(math.floor(w.size / 2))  # half analysis window size by floor
-    x = np.append(np.zeros(hM2), x)  # add zeros at beginning to center first window at sample 0
-    x = np.append(x, np.zeros(hM2))  # add zeros at the end to analyze last sample
-    pin = hM1  # init sound pointer in middle of anal window
-    pend = x.size - hM1  # last sample to start a frame
-    w = w / sum(w)  # normalize analysis window
-    hfreqp = []  # initialize harmonic frequencies of previous frame
-    f0stable = 0  # initialize f0 stable
-    while pin <= pend:
-        x1 = x[pin - hM1:pin + hM2]  # select frame
-        mX, pX = dftModel.dft_anal(x1, w, N)  # compute dft
-        ploc = utilFunctions.peakDetection(mX, t)  # detect peak locations
-        iploc, ipmag, ipphase = utilFunctions.peakInterp(mX, pX, ploc)  # refine peak values
-        ipfreq = fs * iploc / N  # convert locations to Hz
-        f0t = utilFunctions.f0Twm(ipfreq, ipmag, f0et, minf0, maxf0, f0stable)  # find f0
-        if ((f0stable == 0) & (f0t > 0)) \
-                or ((f0stable > 0) & (np.abs(f0stable - f0t) < f0stable / 5.0)):
-            f0stable = f0t  # consider a stable f0 if it is close to the previous one
-        else:
-            f0stable = 0
-        hfreq, hmag, hphase = harmonic_detection(ipfreq, ipmag, ipphase, f0t, nH, hfreqp, fs,
-                                                 harmDevSlope)  # find harmonics
-        hfreqp = hfreq
-        if pin == hM1:  # first frame
-            xhfreq = np.array([hfreq])
-            xhmag = np.array([hmag])
-            xhphase = np.array([hphase])
-        else:  # next frames
-            xhfreq = np.vstack((xhfreq, np.array([hfreq])))
-            xhmag = np.vstack((xhmag, np.array([hmag])))
-            xhphase = np.vstack((xhphase, np.array([hphase])))
-        pin += H  # advance sound pointer
+    size = spectralAnalysis.signal(x).size + 2 * hM2  # size of the sound with half a window of zeros at both ends
+    nFrames = max((size - 2 * hM1) // H + 1, 0)  # frames whose center lies between hM1 and size-hM1 (included)
+    ipfreq, ipmag, ipphase, offsets = spectralAnalysis.peaks(x, fs, w, N, H, t, nFrames)  # peaks of all frames
+    tracer = tracing.active()  # stage functions are only wrapped if tracing is enabled
+    if tracer:
+        tracer.count("harmonic_model_anal", nFrames, ipfreq.size)
+    f0TwmFrames = tracing.timed(tracer, "f0Twm", utilFunctions.f0TwmFrames)
+    harmonicDetection = tracing.timed(tracer, "harmonic_detection", harmonic_detection_frames)
+    f0 = f0TwmFrames(ipfreq, ipmag, offsets, f0et, minf0, maxf0)  # find f0 of all frames
+    xhfreq, xhmag, xhphase = harmonicDetection(ipfreq, ipmag, ipphase, offsets, f0, nH, fs,
+                                               harmDevSlope)  # find harmonics of all frames
     xhfreq = sineModel.clean_sine_tracks(xhfreq, round(fs * minSineDur / H))  # delete tracks shorter than minSineDur
     return xhfreq, xhmag, xhphase
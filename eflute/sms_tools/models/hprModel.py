@@ -3,12 +3,15 @@
 
 import harmonicModel
 import sineModel
+import spectralAnalysis
+import tracing
 import utilFunctions
 
 
+@tracing.traced("hpr_model_anal")
 def hpr_model_anal(x, fs, w, N, H, t, minSineDur, nH, minf0, maxf0, f0et, harmDevSlope):
     """Analysis of a sound using the harmonic plus residual model
-    x: input sound, fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
+    x: input sound (or spectralAnalysis.SpectralAnalysis of the sound), fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
     minSineDur: minimum duration of sinusoidal tracks
     nH: maximum number of harmonics; minf0: minimum fundamental frequency in sound
     maxf0: maximum fundamental frequency in sound; f0et: maximum error accepted in f0 detection algorithm
@@ -19,7 +22,7 @@ def hpr_model_anal(x, fs, w, N, H, t, minSineDur, nH, minf0, maxf0, f0et, harmDe
     # perform harmonic analysis
     hfreq, hmag, hphase = harmonicModel.harmonic_model_anal(x, fs, w, N, H, t, nH, minf0, maxf0, f0et, harmDevSlope, minSineDur)
     Ns = 512
-    xr = utilFunctions.sineSubtraction(x, Ns, H, hfreq, hmag, hphase, fs)  # subtract sinusoids from original sound
+    xr = utilFunctions.sineSubtraction(spectralAnalysis.signal(x), Ns, H, hfreq, hmag, hphase, fs)  # subtract sinusoids from original sound
     return hfreq, hmag, hphase, xr
 
 
@@ -4,13 +4,16 @@
 import harmonicModel
 import sineModel
 import stochasticModel
+import spectralAnalysis
+import tracing
 import utilFunctions
 
 
+@tracing.traced("hps_model_anal")
 def hps_model_anal(x, fs, w, N, H, t, nH, minf0, maxf0, f0et, harmDevSlope, minSineDur, Ns, stocf):
     """
     Analysis of a sound using the harmonic plus stochastic model
-    x: input sound, fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
+    x: input sound (or spectralAnalysis.SpectralAnalysis of the sound), fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
     nH: maximum number of harmonics, minf0: minimum f0 frequency in Hz,
     maxf0: maximim f0 frequency in Hz; f0et: error threshold in the f0 detection (ex: 5),
     harmDevSlope: slope of harmonic deviation; minSineDur: minimum length of harmonics
@@ -20,7 +23,7 @@ def hps_model_anal(x, fs, w, N, H, t, nH, minf0, maxf0, f0et, harmDevSlope, minS
     # perform harmonic analysis
     hfreq, hmag, hphase = harmonicModel.harmonic_model_anal(x, fs, w, N, H, t, nH, minf0, maxf0, f0et, harmDevSlope, minSineDur)
     # subtract sinusoids from original sound
-    xr = utilFunctions.sineSubtraction(x, Ns, H, hfreq, hmag, hphase, fs)
+    xr = utilFunctions.sineSubtraction(spectralAnalysis.signal(x), Ns, H, hfreq, hmag, hphase, fs)
     # perform stochastic analysis of residual
     stocEnv = stochasticModel.stochastic_model_anal(xr, H, H * 2, stocf)
     return hfreq, hmag, hphase, stocEnv
@@ -0,0 +1,68 @@
+# functions that run frame-based analysis of long sounds in a pool of processes
+# (frames are independent, so hop-aligned segments of a sound can be analyzed separately and stitched back)
+
+import multiprocessing
+
+import numpy as np
+
+SEGMENTS_PER_PROCESS = 4  # segments given to each process, to balance the load between processes
+
+
+def frame_segments(nFrames, nSegments):
+    """
+    Split a range of frames into consecutive segments of similar size
+    nFrames: number of frames, nSegments: number of segments
+    returns list of (b, e): first and last (excluded) frame of every non empty segment
+    """
+
+    bounds = np.linspace(0, nFrames, max(min(nSegments, nFrames), 1) + 1).astype(int)
+    return [(b, e) for b, e in zip(bounds[:-1], bounds[1:]) if e > b]
+
+
+def _apply(job):
+    """
+    Run the analysis of one segment in a worker process
+    """
+
+    func, xseg, nFrames, args = job
+    return func(xseg, nFrames, *args)
+
+
+def map_frames(func, x, M, H, nFrames, args=(), processes=None):
+    """
+    Analyze the frames of a sound in hop-aligned segments, in parallel, and stitch the results
+    func: function called as func(xseg, nFrames, *args) on a segment xseg holding nFrames frames of size M,
+          it has to be defined at module level and return an array whose rows follow the frames
+          (e.g. one row per frame), a tuple of such arrays, or a list with one item per frame
+    x: input array sound (already padded), M: frame size, H: hop size, nFrames: number of frames of x
+    args: extra arguments of func, processes: number of processes (default: number of cpus, 1: no pool)
+    returns the results of func as if it was called on all the frames at once
+    """
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or nFrames <= 1:  # serial analysis
+        return func(x[:max(nFrames - 1, 0) * H + M], nFrames, *args)
+
+    segments = frame_segments(nFrames, SEGMENTS_PER_PROCESS * processes)
+    jobs = [(func, x[b * H:(e - 1) * H + M], e - b, args) for b, e in segments]  # segments overlap by M-H samples
+    pool = multiprocessing.Pool(min(processes, len(jobs)))
+    try:
+        results = pool.map(_apply, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    if isinstance(results[0], tuple):  # stitch every output separately
+        return tuple(_stitch([r[i] for r in results]) for i in range(len(results[0])))
+    return _stitch(results)
+
+
+def _stitch(results):
+    """
+    Join the results of consecutive segments
+    """
+
+    if isinstance(results[0], list):
+        return [item for r in results for item in r]
+    return np.concatenate(results)
@@ -2,12 +2,27 @@
 # (for example usage check the examples models_interface)
 
 import numpy as np
-from scipy.signal import blackmanharris, triang
-from scipy.fftpack import ifft, fftshift
+from scipy.fftpack import fftshift
 import math
-import dftModel
+import spectralAnalysis
+import stft
+import tracing
 import utilFunctions
 
+# method "auto" of sine_model_synth uses the oscillators if active tracks per frame * H < OSCILLATOR_DENSITY * N*log2(N)
+OSCILLATOR_DENSITY = 0.1
+
+
+def _alive(parent, k):
+    """
+    Follow the links of removed positions up to an alive one, shortening the path on the way
+    """
+
+    while parent[k] != k:
+        parent[k] = parent[parent[k]]
+        k = parent[k]
+    return k
+
 
 def sine_tracking(pfreq, pmag, pphase, tfreq, freqDevOffset=20, freqDevSlope=0.01):
     """
@@ -22,36 +37,56 @@ def sine_tracking(pfreq, pmag, pphase, tfreq, freqDevOffset=20, freqDevSlope=0.0
     tfreqn = np.zeros(tfreq.size)  # initialize array for output frequencies
     tmagn = np.zeros(tfreq.size)  # initialize array for output magnitudes
     tphasen = np.zeros(tfreq.size)  # initialize array for output phases
-    pindexes = np.array(np.nonzero(pfreq), dtype=np.int)[0]  # indexes of current peaks
-    incomingTracks = np.array(np.nonzero(tfreq), dtype=np.int)[0]  # indexes of incoming tracks
-    newTracks = np.zeros(tfreq.size, dtype=np.int) - 1  # initialize to -1 new tracks
+    pindexes = np.nonzero(pfreq)[0]  # indexes of current peaks
+    incomingTracks = np.nonzero(tfreq)[0]  # indexes of incoming tracks
+    newTracks = np.zeros(tfreq.size, dtype=int) - 1  # initialize to -1 new tracks
     magOrder = np.argsort(-pmag[pindexes])  # order current peaks by magnitude
-    pfreqt = np.copy(pfreq)  # copy current peaks to temporary array
-    pmagt = np.copy(pmag)  # copy current peaks to temporary array
-    pphaset = np.copy(pphase)  # copy current peaks to temporary array
-
-    # continue incoming tracks
-    if incomingTracks.size > 0:  # if incoming tracks exist
-        for i in magOrder:  # iterate over current peaks
-            if incomingTracks.size == 0:  # break when no more incoming tracks
-                break
-            track = np.argmin(abs(pfreqt[i] - tfreq[incomingTracks]))  # closest incoming track to peak
-            freqDistance = abs(pfreq[i] - tfreq[incomingTracks[track]])  # measure freq distance
-            if freqDistance < (freqDevOffset + freqDevSlope * pfreq[i]):  # choose track if distance is small
-                newTracks[incomingTracks[track]] = i  # assign peak index to track index
-                incomingTracks = np.delete(incomingTracks, track)  # delete index of track in incomming tracks
-    indext = np.array(np.nonzero(newTracks != -1), dtype=np.int)[0]  # indexes of assigned tracks
+
+    # continue incoming tracks: every peak, by decreasing magnitude, takes the closest incoming track still free
+    # (the one with the lowest index if several are at the same distance) if it is close enough
+    if incomingTracks.size > 0 and magOrder.size > 0:
+        order = incomingTracks[np.argsort(tfreq[incomingTracks], kind="mergesort")]  # tracks by frequency and index
+        sfreq = tfreq[order]  # sorted frequencies of incoming tracks
+        pos = np.searchsorted(sfreq, pfreq[magOrder]).tolist()  # first track not below every peak
+        sfreq = sfreq.tolist()
+        order = order.tolist()
+        nTracks = len(order)
+        right = list(range(nTracks + 1))  # right[k]: first free track at sorted position k or after
+        left = list(range(nTracks + 1))  # left[k]: one plus the last free track before sorted position k
+        free = nTracks  # number of incoming tracks still free
+        for i, k in zip(magOrder.tolist(), pos):
+            f = pfreq[i]
+            r = _alive(right, k)  # closest free track above, lowest index among equal frequencies
+            l = _alive(left, k) - 1  # closest free track below
+            q = _alive(left, l) - 1 if l >= 0 else -1
+            while q >= 0 and sfreq[q] == sfreq[l]:  # move to the lowest index of equal frequencies
+                l, q = q, _alive(left, q) - 1
+            if r == nTracks or (l >= 0 and (abs(f - sfreq[l]) < abs(f - sfreq[r]) or (
+                    abs(f - sfreq[l]) == abs(f - sfreq[r]) and order[l] < order[r]))):
+                track = l
+            else:
+                track = r
+            if abs(f - sfreq[track]) < (freqDevOffset + freqDevSlope * f):  # choose track if distance is small
+                newTracks[order[track]] = i  # assign peak index to track index
+                right[track] = track + 1  # the track is not free anymore
+                left[track + 1] = track
+                free -= 1
+                if free == 0:  # stop when no more incoming tracks
+                    break
+    indext = np.nonzero(newTracks != -1)[0]  # indexes of assigned tracks
+    unused = np.ones(pfreq.size, dtype=bool)  # peaks not used to continue tracks
     if indext.size > 0:
         indexp = newTracks[indext]  # indexes of assigned peaks
-        tfreqn[indext] = pfreqt[indexp]  # output freq tracks
-        tmagn[indext] = pmagt[indexp]  # output mag tracks
-        tphasen[indext] = pphaset[indexp]  # output phase tracks
-        pfreqt = np.delete(pfreqt, indexp)  # delete used peaks
-        pmagt = np.delete(pmagt, indexp)  # delete used peaks
-        pphaset = np.delete(pphaset, indexp)  # delete used peaks
+        tfreqn[indext] = pfreq[indexp]  # output freq tracks
+        tmagn[indext] = pmag[indexp]  # output mag tracks
+        tphasen[indext] = pphase[indexp]  # output phase tracks
+        unused[indexp] = False
+    pfreqt = pfreq[unused]  # peaks left
+    pmagt = pmag[unused]
+    pphaset = pphase[unused]
 
     # create new tracks from non used peaks
-    emptyt = np.array(np.nonzero(tfreq == 0), dtype=np.int)[0]  # indexes of empty incoming tracks
+    emptyt = np.nonzero(tfreq == 0)[0]  # indexes of empty incoming tracks
     peaksleft = np.argsort(-pmagt)  # sort left peaks by magnitude
     if ((peaksleft.size > 0) & (emptyt.size >= peaksleft.size)):  # fill empty tracks
         tfreqn[emptyt[:peaksleft.size]] = pfreqt[peaksleft]
@@ -67,41 +102,73 @@ def sine_tracking(pfreq, pmag, pphase, tfreq, freqDevOffset=20, freqDevSlope=0.0
     return tfreqn, tmagn, tphasen
 
 
+@tracing.traced("clean_sine_tracks")
 def clean_sine_tracks(tfreq, minTrackLength=3):
     """
     Delete short fragments of a collection of sinusoidal tracks 
-    tfreq: frequency of tracks
+    tfreq: frequency of tracks, or utilFunctions.SparseTracks
     minTrackLength: minimum duration of tracks in number of frames
-    returns tfreqn: output frequency of tracks
-    """
-
-    if tfreq.shape[1] == 0:  # if no tracks return input
-        return tfreq
-    nFrames = tfreq[:, 0].size  # number of frames
-    nTracks = tfreq[0, :].size  # number of tracks in a frame
-    for t in range(nTracks):  # iterate over all tracks
-        trackFreqs = tfreq[:, t]  # frequencies of one track
-        trackBegs = np.nonzero((trackFreqs[:nFrames - 1] <= 0)  # begining of track contours
-                               & (trackFreqs[1:] > 0))[0] + 1
-        if trackFreqs[0] > 0:
-            trackBegs = np.insert(trackBegs, 0, 0)
-        trackEnds = np.nonzero((trackFreqs[:nFrames - 1] > 0)  # end of track contours
-                               & (trackFreqs[1:] <= 0))[0] + 1
-        if trackFreqs[nFrames - 1] > 0:
-            trackEnds = np.append(trackEnds, nFrames - 1)
-        trackLengths = 1 + trackEnds - trackBegs  # lengths of trach contours
-        for i, j in zip(trackBegs, trackLengths):  # delete short track contours
-            if j <= minTrackLength:
-                trackFreqs[i:i + j] = 0
-    return tfreq
-
-
-def sine_model_anal(x, fs, w, N, H, t, maxnSines=100, minSineDur=.01, freqDevOffset=20, freqDevSlope=0.01):
+    returns tfreqn: output frequency of tracks (the same SparseTracks, without the short fragments)
+    """
+
+    if isinstance(tfreq, utilFunctions.SparseTracks):
+        return tfreq.clean(minTrackLength)
+    return utilFunctions.cleaningTracks(tfreq, minTrackLength)  # delete short track contours in place
+
+
+class TrackStore(object):
+    """
+    Output tracks of an analysis, allocated once for all frames and filled frame by frame
+    nFrames: number of frames, nTracks: maximum number of tracks per frame
+    sparse: keep only the active tracks of every frame, written in frame order, instead of the track matrices
+    """
+
+    def __init__(self, nFrames, nTracks, sparse=False):
+        self.nTracks = nTracks
+        self.cells = [] if sparse else None  # track, frequency, magnitude and phase of the active tracks of every frame
+        if not sparse:
+            self.freq = np.zeros((nFrames, nTracks))  # track frequencies, one row per frame
+            self.mag = np.zeros((nFrames, nTracks))  # track magnitudes
+            self.phase = np.zeros((nFrames, nTracks))  # track phases
+
+    def write(self, l, tfreq, tmag, tphase):
+        """
+        Store the tracks of frame l, the tracks after tfreq.size stay at zero
+        """
+
+        if self.cells is not None:
+            k = np.nonzero(tfreq > 0)[0]  # active tracks
+            self.cells.append((k, tfreq[k], tmag[k], tphase[k]))
+            return
+        self.freq[l, :tfreq.size] = tfreq
+        self.mag[l, :tmag.size] = tmag
+        self.phase[l, :tphase.size] = tphase
+
+    def sparse(self):
+        """
+        returns utilFunctions.SparseTracks with the tracks of the written frames
+        """
+
+        offsets = np.zeros(len(self.cells) + 1, dtype=np.intp)
+        offsets[1:] = np.cumsum([c[0].size for c in self.cells])
+        values = [np.concatenate([np.zeros(0)] + [c[i] for c in self.cells]) for i in range(4)]
+        return utilFunctions.SparseTracks(offsets, values[0].astype(np.int32), values[1], values[2], values[3],
+                                          self.nTracks)
+
+
+@tracing.traced("sine_model_anal")
+def sine_model_anal(x, fs, w, N, H, t, maxnSines=100, minSineDur=.01, freqDevOffset=20, freqDevSlope=0.01,
+                    processes=1, maxnPeaks=None, sparse=False):
     """
     Analysis of a sound using the sinusoidal model with sine tracking
-    x: input array sound, w: analysis window, N: size of complex spectrum, H: hop-size, t: threshold in negative dB
+    x: input array sound (or spectralAnalysis.SpectralAnalysis of the sound), w: analysis window, N: size of complex spectrum, H: hop-size, t: threshold in negative dB
     maxnSines: maximum number of sines per frame, minSineDur: minimum duration of sines in seconds
     freqDevOffset: minimum frequency deviation at 0Hz, freqDevSlope: slope increase of minimum frequency deviation
+    processes: number of processes detecting the peaks of segments of the sound in parallel (None: one per cpu),
+               the tracking always runs serially over the peaks of all frames
+    maxnPeaks: maximum number of peaks of every frame given to the tracking, the ones with highest magnitude
+               (None: all peaks above the threshold; maxnSines prunes the peaks before tracking instead of after)
+    sparse: return the tracks as one utilFunctions.SparseTracks, never allocating the track matrices
     returns xtfreq, xtmag, xtphase: frequencies, magnitudes and phases of sinusoidal tracks
     """
 
@@ -110,75 +177,217 @@ def sine_model_anal(x, fs, w, N, H, t, maxnSines=100, minSineDur=.01, freqDevOff
 
     hM1 = int(math.floor((w.size + 1) / 2))  # half analysis window size by rounding
     hM2 = int(math.floor(w.size / 2))  # half analysis window size by floor
-    x = np.append(np.zeros(hM2), x)  # add zeros at beginning to center first window at sample 0
-    x = np.append(x, np.zeros(hM2))  # add zeros at the end to analyze last sample
-    pin = hM1  # initialize sound pointer in middle of analysis window
-    pend = x.size - hM1  # last sample to start a frame
-    w = w / sum(w)  # normalize analysis window
+    size = spectralAnalysis.signal(x).size + 2 * hM2  # size of the sound with half a window of zeros at both ends
+    nFrames = -(-(size - 2 * hM1) // H)  # frames whose center lies between hM1 and size-hM1 (excluded)
+    # peaks of frame l are at offsets[l]:offsets[l+1]
+    pfreq, pmag, pphase, offsets = spectralAnalysis.peaks(x, fs, w, N, H, t, nFrames, maxnPeaks, processes)
+    tracer = tracing.active()  # stage functions are only wrapped if tracing is enabled
+    sineTracking = tracing.timed(tracer, "sine_tracking", sine_tracking)
+    tracks = TrackStore(nFrames, maxnSines, sparse)  # output sine tracks
     tfreq = np.array([])
-    while pin < pend:  # while input sound pointer is within sound
-        x1 = x[pin - hM1:pin + hM2]  # select frame
-        mX, pX = dftModel.dft_anal(x1, w, N)  # compute dft
-        ploc = utilFunctions.peakDetection(mX, t)  # detect locations of peaks
-        iploc, ipmag, ipphase = utilFunctions.peakInterp(mX, pX, ploc)  # refine peak values by interpolation
-        ipfreq = fs * iploc / float(N)  # convert peak locations to Hertz
+    for l, (b, e) in enumerate(zip(offsets[:-1], offsets[1:])):
+        ipfreq, ipmag, ipphase = pfreq[b:e], pmag[b:e], pphase[b:e]  # peaks of the frame
+        if tracer:
+            tracer.count("sine_model_anal", 1, ipfreq.size)
         # perform sinusoidal tracking by adding peaks to trajectories
-        tfreq, tmag, tphase = sine_tracking(ipfreq, ipmag, ipphase, tfreq, freqDevOffset, freqDevSlope)
+        tfreq, tmag, tphase = sineTracking(ipfreq, ipmag, ipphase, tfreq, freqDevOffset, freqDevSlope)
         tfreq = np.resize(tfreq, min(maxnSines, tfreq.size))  # limit number of tracks to maxnSines
         tmag = np.resize(tmag, min(maxnSines, tmag.size))  # limit number of tracks to maxnSines
         tphase = np.resize(tphase, min(maxnSines, tphase.size))  # limit number of tracks to maxnSines
-        jtfreq = np.zeros(maxnSines)  # temporary output array
-        jtmag = np.zeros(maxnSines)  # temporary output array
-        jtphase = np.zeros(maxnSines)  # temporary output array
-        jtfreq[:tfreq.size] = tfreq  # save track frequencies to temporary array
-        jtmag[:tmag.size] = tmag  # save track magnitudes to temporary array
-        jtphase[:tphase.size] = tphase  # save track magnitudes to temporary array
-        if pin == hM1:  # if first frame initialize output sine tracks
-            xtfreq = jtfreq
-            xtmag = jtmag
-            xtphase = jtphase
-        else:  # rest of frames append values to sine tracks
-            xtfreq = np.vstack((xtfreq, jtfreq))
-            xtmag = np.vstack((xtmag, jtmag))
-            xtphase = np.vstack((xtphase, jtphase))
-        pin += H
+        tracks.write(l, tfreq, tmag, tphase)  # save tracks of the frame
+    if sparse:
+        return clean_sine_tracks(tracks.sparse(), round(fs * minSineDur / H))
+    xtfreq, xtmag, xtphase = tracks.freq, tracks.mag, tracks.phase
     # delete sine tracks shorter than minSineDur
     xtfreq = clean_sine_tracks(xtfreq, round(fs * minSineDur / H))
     return xtfreq, xtmag, xtphase
 
 
-def sine_model_synth(tfreq, tmag, tphase, N, H, fs):
+def sine_model_synth_oscillators(tfreq, tmag, tphase, H, fs):
+    """
+    Synthesis of a sound using the sinusoidal model with a bank of oscillators, evaluated only where tracks are active
+    (frequencies and amplitudes are interpolated linearly between frames, tracks ramp their amplitude from or to 0
+    over one hop when they begin or end)
+    tfreq,tmag,tphase: frequencies, magnitudes and phases of sinusoids (phases of the beginning of every track,
+                       if no phases they are random)
+    H: hop size, fs: sampling rate
+    returns y: output array sound, frame l is centered at sample l*H
+    """
+
+    L, nTracks = tfreq.shape  # number of frames and tracks
+    y = np.zeros(H * L)  # initialize output array
+    ytphase = 2 * np.pi * np.random.rand(nTracks)  # initialize synthesis phases
+    freq = np.zeros((L + 1, nTracks))  # track frequencies, all tracks end after the last frame
+    freq[:L] = np.maximum(tfreq, 0)
+    amp = np.zeros((L + 1, nTracks))  # track amplitudes
+    amp[:L] = np.where(tfreq > 0, 2 * 10 ** (tmag / 20), 0)
+    # hops from frame l to l+1 where track k is active at either end, sorted by track and frame
+    k, l = np.nonzero((freq[:-1] > 0).T | (freq[1:] > 0).T)
+    f0, f1 = freq[l, k], freq[l + 1, k]
+    f0 = np.where(f0 > 0, f0, f1)  # a beginning track takes the frequency of its first frame
+    f1 = np.where(f1 > 0, f1, f0)  # an ending track keeps the frequency of its last frame
+    a0, a1 = amp[l, k], amp[l + 1, k]
+    inc = np.mod(2 * np.pi / fs * (f0 * H + (f1 - f0) * (H - 1) / 2.0), 2 * np.pi)  # phase increment of every hop
+
+    # phase at the beginning of every hop, accumulated from the beginning of its track
+    begin = (l == 0) | (freq[l, k] == 0)  # first hop of every contour
+    begins = np.nonzero(begin)[0]
+    if (tphase.size > 0):  # start at the phase of the first frame of the contour
+        ramp = freq[l[begins], k[begins]] == 0  # the track is silent at the first frame of the hop
+        begphase = tphase[l[begins] + ramp, k[begins]] - np.where(ramp, inc[begins], 0)
+    else:
+        begphase = ytphase[k[begins]]
+    contour = np.cumsum(begin) - 1  # contour of every hop
+    acc = np.cumsum(inc) - inc  # phase accumulated before every hop
+    hphase = begphase[contour] + acc - acc[begins][contour]
+
+    order = np.argsort(l, kind="mergesort")  # synthesize the hops by frame, to overlap-add them in short spans
+    j = np.arange(H)  # samples of one hop
+    jj = j * (j - 1) / (2.0 * H)  # accumulated frequency interpolation factors
+    for b in range(0, l.size, stft.FRAME_BLOCK):  # synthesize the hops in blocks to bound temporary memory
+        i = order[b:b + stft.FRAME_BLOCK]
+        df = f1[i] - f0[i]  # frequency change over the hop
+        phase = np.multiply.outer(2 * np.pi / fs * f0[i], j)
+        phase += np.multiply.outer(2 * np.pi / fs * df, jj)
+        phase += hphase[i, np.newaxis]
+        yh = np.cos(phase)
+        yh *= a0[i, np.newaxis] + np.multiply.outer(a1[i] - a0[i], j / float(H))  # amplitude of every sample
+        pout = H * l[i[0]]  # first sample of the block
+        index = (H * l[i] - pout)[:, np.newaxis] + j  # output position of every sample from pout
+        span = H * (l[i[-1]] + 1) - pout
+        y[pout:pout + span] += np.bincount(index.ravel(), weights=yh.ravel(), minlength=span)
+    return y
+
+
+def sine_model_synth(tfreq, tmag, tphase, N, H, fs, method="fft"):
     """
     Synthesis of a sound using the sinusoidal model
-    tfreq,tmag,tphase: frequencies, magnitudes and phases of sinusoids
+    tfreq,tmag,tphase: frequencies, magnitudes and phases of sinusoids,
+                       or a utilFunctions.SparseTracks as tfreq (tmag and tphase are then ignored)
     N: synthesis FFT size, H: hop size, fs: sampling rate
+    method: "fft" to overlap-add the inverse FFTs of the spectra of the sines,
+            "oscillators" to use sine_model_synth_oscillators, whose cost grows with the number of active tracks
+            instead of N, or "auto" to use the oscillators when there are few active tracks per frame
     returns y: output array sound
     """
 
-    hN = N / 2  # half of FFT size for synthesis
-    L = tfreq.shape[0]  # number of frames
-    pout = 0  # initialize output sound pointer
+    sparse = isinstance(tfreq, utilFunctions.SparseTracks)
+    if method == "auto":  # compare the cost of the oscillators with the cost of the FFTs
+        active = tfreq.freq.size if sparse else np.count_nonzero(tfreq > 0)
+        density = active / float(max(tfreq.nFrames if sparse else tfreq.shape[0], 1))  # active tracks per frame
+        method = "oscillators" if density * H < OSCILLATOR_DENSITY * N * math.log(N, 2) else "fft"
+    if sparse and (method != "fft" or tfreq.phase is None):  # the oscillators and phase generation need matrices
+        tfreq, tmag, tphase = tfreq.toDense()
+        sparse = False
+    if method == "oscillators":
+        y = np.zeros(max(H * (tfreq.shape[0] + 3) - N, 0))  # same output size as the FFT synthesis
+        yo = sine_model_synth_oscillators(tfreq, tmag, tphase, H, fs)
+        y[:yo.size] = yo[:y.size]
+        return y
+    if method != "fft":
+        raise ValueError("Synthesis method is not 'fft', 'oscillators' or 'auto'")
+
+    hN = N // 2  # half of FFT size for synthesis
+    L = tfreq.nFrames if sparse else tfreq.shape[0]  # number of frames
     ysize = H * (L + 3)  # output sound size
     y = np.zeros(ysize)  # initialize output array
-    sw = np.zeros(N)  # initialize synthesis window
-    ow = triang(2 * H)  # triangular window
-    sw[hN - H:hN + H] = ow  # add triangular window
-    bh = blackmanharris(N)  # blackmanharris window
-    bh = bh / sum(bh)  # normalized blackmanharris window
-    sw[hN - H:hN + H] = sw[hN - H:hN + H] / bh[hN - H:hN + H]  # normalized synthesis window
-    lastytfreq = tfreq[0, :]  # initialize synthesis frequencies
-    ytphase = 2 * np.pi * np.random.rand(tfreq[0, :].size)  # initialize synthesis phases
-    for l in range(L):  # iterate over all frames
-        if (tphase.size > 0):  # if no phases generate them
-            ytphase = tphase[l, :]
+    sw = utilFunctions.synthesisWindow(N, H)  # synthesis window, shared by all calls with the same N and H
+    ytphase = 2 * np.pi * np.random.rand(tfreq.nTracks if sparse else tfreq.shape[1])  # initialize synthesis phases
+    if not sparse and (tphase.size == 0):  # if no phases generate them
+        lastytfreq = np.vstack((tfreq[:1, :], tfreq[:-1, :]))  # frequencies of the previous frames
+        ytphase = ytphase + np.cumsum((np.pi * (lastytfreq + tfreq) / fs) * H, axis=0)  # propagate phases
+        tphase = ytphase % (2 * np.pi)  # make phase inside 2*pi
+    for b in range(0, L, stft.FRAME_BLOCK):  # synthesize the frames in blocks to bound temporary memory
+        e = min(b + stft.FRAME_BLOCK, L)
+        if sparse:
+            frame, track, freq, mag, phase = tfreq.frames(b, e)  # active sines of the block
+            Y = utilFunctions.genSpecSinesFlat(e - b, frame, freq, mag, phase, N, fs)  # generate sines
         else:
-            ytphase += (np.pi * (lastytfreq + tfreq[l, :]) / fs) * H  # propagate phases
-        Y = utilFunctions.genSpecSines(tfreq[l, :], tmag[l, :], ytphase, N, fs)  # generate sines in the spectrum
-        lastytfreq = tfreq[l, :]  # save frequency for phase propagation
-        ytphase = ytphase % (2 * np.pi)  # make phase inside 2*pi
-        yw = np.real(fftshift(ifft(Y)))  # compute inverse FFT
-        y[pout:pout + N] += sw * yw  # overlap-add and apply a synthesis window
-        pout += H  # advance sound pointer
-    y = np.delete(y, range(hN))  # delete half of first window
-    y = np.delete(y, range(y.size - hN, y.size))  # delete half of the last window
-    return y
+            Y = utilFunctions.genSpecSinesFrames(tfreq[b:e], tmag[b:e], tphase[b:e], N, fs)  # generate sines
+        yw = fftshift(np.fft.irfft(Y[:, :hN + 1], N, axis=1), axes=1)  # compute inverse FFT of all frames
+        stft.overlap_add(y, sw * yw, H, b * H)  # overlap-add and apply a synthesis window
+    return y[hN:y.size - hN]  # delete half of the first and last windows
+
+
+class SineSynthStream(object):
+    """
+    Streaming synthesis of a sound using the sinusoidal model, for tracks produced a few frames at a time
+    N: synthesis FFT size, H: hop size, fs: sampling rate
+    Every frame pushed gives H samples, from H samples before its center up to its center: the latency is one hop,
+    a sample only needs the frames whose centers are at most H samples after it. Pushing all the frames of tracks
+    and then flushing gives the output of sine_model_synth (with the same phases) preceded by H samples
+    """
+
+    def __init__(self, N, H, fs):
+        if 2 * H > N:  # raise error if the synthesis window does not fit in the FFT size
+            raise ValueError("Hop size (H) bigger than half the FFT size")
+
+        self.N = N  # synthesis FFT size
+        self.H = H  # hop size
+        self.fs = fs  # sampling rate
+        self.sw = utilFunctions.synthesisWindow(N, H)  # synthesis window
+        self.buffer = np.zeros(N)  # overlap-add of the frames pushed so far, starting where the next frame starts
+        self.ytphase = np.zeros(0)  # synthesis phases of the tracks when the frames have no phases
+        self.lastfreq = None  # track frequencies of the last frame, None before the first one
+        self.closed = False  # set by flush at the end of the stream
+
+    def _phases(self, tfreq):
+        """
+        Propagate the phases of the tracks of the frames, like sine_model_synth when the tracks have no phases
+        """
+
+        nTracks = tfreq.shape[1]
+        if self.ytphase.size < nTracks:  # new tracks start at random phases
+            self.ytphase = np.append(self.ytphase, 2 * np.pi * np.random.rand(nTracks - self.ytphase.size))
+        lastfreq = np.zeros(max(nTracks, self.ytphase.size))
+        if self.lastfreq is None:  # the first frame has no previous frame
+            lastfreq[:nTracks] = tfreq[0]
+        else:
+            lastfreq[:self.lastfreq.size] = self.lastfreq
+        freq = np.zeros((tfreq.shape[0], lastfreq.size))
+        freq[:, :nTracks] = tfreq
+        lastytfreq = np.vstack((lastfreq, freq[:-1]))  # frequencies of the previous frames
+        ytphase = self.ytphase + np.cumsum((np.pi * (lastytfreq + freq) / self.fs) * self.H, axis=0)
+        self.ytphase = ytphase[-1] % (2 * np.pi)
+        return ytphase[:, :nTracks] % (2 * np.pi)
+
+    def push(self, tfreq, tmag, tphase=None):
+        """
+        Add the tracks of one or several frames
+        tfreq, tmag, tphase: frequencies, magnitudes and phases of the tracks of one frame, or of several frames
+                             (one frame per row), tphase None to propagate the phases between frames
+        returns y: H output samples per frame
+        """
+
+        if self.closed:  # raise error if the stream already ended
+            raise ValueError("Stream already flushed")
+
+        tfreq, tmag = np.atleast_2d(tfreq), np.atleast_2d(tmag)
+        L = tfreq.shape[0]  # number of frames
+        if L == 0:  # no frames
+            return np.zeros(0)
+        tphase = self._phases(tfreq) if tphase is None else np.atleast_2d(tphase)
+        self.lastfreq = tfreq[-1]
+        hN = self.N // 2  # half of FFT size for synthesis
+        y = np.zeros(L * self.H + self.N)  # output of the frames, after the samples pending from the previous ones
+        y[:self.N] = self.buffer
+        for b in range(0, L, stft.FRAME_BLOCK):  # synthesize the frames in blocks to bound temporary memory
+            e = min(b + stft.FRAME_BLOCK, L)
+            Y = utilFunctions.genSpecSinesFrames(tfreq[b:e], tmag[b:e], tphase[b:e], self.N, self.fs)
+            yw = fftshift(np.fft.irfft(Y[:, :hN + 1], self.N, axis=1), axes=1)  # compute inverse FFT of all frames
+            stft.overlap_add(y, self.sw * yw, self.H, b * self.H)  # overlap-add and apply a synthesis window
+        self.buffer = y[L * self.H:]
+        return y[hN - self.H:hN - self.H + L * self.H]  # samples no later frame adds to
+
+    def flush(self):
+        """
+        End the stream
+        returns y: last H samples, up to H samples after the center of the last frame
+        """
+
+        if self.closed:  # raise error if the stream already ended
+            raise ValueError("Stream already flushed")
+
+        self.closed = True
+        hN = self.N // 2  # half of FFT size for synthesis
+        return self.buffer[hN - self.H:hN]
@@ -0,0 +1,138 @@
+# spectral analysis shared by the analysis functions of the models: the spectral peaks of all the frames of a sound,
+# computed once and given to several functions instead of the sound
+#
+# Usage:
+#     analysis = spectralAnalysis.spectral_analysis(x, fs, w, N, H, t)
+#     f0 = harmonicModel.f0_detection(analysis, fs, w, N, H, t, minf0, maxf0, f0et)
+#     hfreq, hmag, hphase, stocEnv = hpsModel.hps_model_anal(analysis, fs, w, N, H, t, nH, minf0, maxf0, f0et,
+#                                                            harmDevSlope, minSineDur, Ns, stocf)
+# The functions raise ValueError if their parameters are not the ones of the analysis.
+#
+# All the models analyze the same frames, frame l centered at sample l*H, they only differ in their number of
+# frames; the analysis holds the frames of the model with most frames (harmonic_model_anal).
+
+import math
+
+import numpy as np
+
+import dftModel
+import parallel
+import stft
+import tracing
+import utilFunctions
+
+
+class SpectralAnalysis(object):
+    """
+    Spectral peaks of all the frames of a sound, and the parameters of their analysis
+    x: input sound, fs: sampling rate, w: analysis window, N: FFT size, H: hop size, t: threshold in negative dB
+    maxnPeaks: maximum number of peaks of every frame (None: all peaks above the threshold)
+    pfreq, pmag, pphase: peak frequencies, magnitudes and phases of all frames, one after the other
+    offsets: peaks of frame l are at offsets[l]:offsets[l+1]
+    """
+
+    def __init__(self, x, fs, w, N, H, t, maxnPeaks, pfreq, pmag, pphase, offsets):
+        self.x = x
+        self.fs = fs
+        self.w = w
+        self.N = N
+        self.H = H
+        self.t = t
+        self.maxnPeaks = maxnPeaks
+        self.pfreq = pfreq
+        self.pmag = pmag
+        self.pphase = pphase
+        self.offsets = offsets
+
+    @property
+    def nFrames(self):
+        return self.offsets.size - 1
+
+    def check(self, fs, w, N, H, t, maxnPeaks=None):
+        """
+        Raise ValueError if the parameters of an analysis function are not the ones of the spectral analysis
+        """
+
+        if (fs != self.fs) or (N != self.N) or (H != self.H) or (t != self.t) or (maxnPeaks != self.maxnPeaks) \
+                or not np.array_equal(w, self.w):
+            raise ValueError("Parameters are not the ones of the spectral analysis")
+
+    def peaks(self, nFrames):
+        """
+        Peaks of the first nFrames frames
+        returns pfreq, pmag, pphase, offsets: peaks of all the frames, one after the other, and their offsets
+        """
+
+        offsets = self.offsets[:nFrames + 1]
+        e = offsets[-1]
+        return self.pfreq[:e], self.pmag[:e], self.pphase[:e], offsets
+
+
+def signal(x):
+    """
+    returns the sound of x, a sound or a SpectralAnalysis
+    """
+
+    return x.x if isinstance(x, SpectralAnalysis) else x
+
+
+def _peaks_segment(x, nFrames, w, N, H, fs, t, maxnPeaks=None):
+    """
+    Spectral peaks of the first nFrames frames of a padded sound, also run on segments by parallel.map_frames
+    returns ipfreq, ipmag, ipphase, counts: peak frequencies, magnitudes and phases of all frames, one after the other,
+            and number of peaks of every frame
+    """
+
+    plan = dftModel.DFTPlan(w, N)  # window and buffers shared by all frames
+    tracer = tracing.active()  # stage functions are only wrapped if tracing is enabled
+    dft_anal = tracing.timed(tracer, "dft_anal", plan.anal_frames)
+    peakDetection = tracing.timed(tracer, "peakDetection", utilFunctions.peakDetectionFrames)
+    peakInterp = tracing.timed(tracer, "peakInterp", utilFunctions.peakInterpFrames)
+    xframes = stft.frame_view(x, w.size, H, nFrames)  # all frames as a strided view
+    results = ([np.zeros(0)], [np.zeros(0)], [np.zeros(0)], [np.zeros(0, dtype=int)])
+    for b in range(0, nFrames, stft.FRAME_BLOCK):  # analyze the frames in blocks to bound temporary memory
+        mX, pX = dft_anal(xframes[b:b + stft.FRAME_BLOCK])  # compute dft of all frames of the block
+        ploc, offsets = peakDetection(mX, t, maxnPeaks)  # detect locations of peaks
+        iploc, ipmag, ipphase = peakInterp(mX, pX, ploc, offsets)  # refine peak values by interpolation
+        for r, values in zip(results, (fs * iploc / float(N), ipmag, ipphase, np.diff(offsets))):
+            r.append(values)
+    return tuple(np.concatenate(r) for r in results)
+
+
+def peaks(x, fs, w, N, H, t, nFrames, maxnPeaks=None, processes=1):
+    """
+    Spectral peaks of the first nFrames frames of a sound, frame l centered at sample l*H
+    x: input sound or SpectralAnalysis (whose parameters have to be the given ones), fs: sampling rate,
+    w: analysis window, N: FFT size, H: hop size, t: threshold in negative dB, nFrames: number of frames
+    maxnPeaks: maximum number of peaks of every frame, processes: number of processes (None: one per cpu)
+    returns pfreq, pmag, pphase, offsets: peaks of all frames, one after the other, frame l at offsets[l]:offsets[l+1]
+    """
+
+    if isinstance(x, SpectralAnalysis):
+        x.check(fs, w, N, H, t, maxnPeaks)
+        return x.peaks(nFrames)
+    hM2 = int(math.floor(w.size / 2))  # half analysis window size by floor
+    x = np.concatenate((np.zeros(hM2), x, np.zeros(hM2)))  # center first window at sample 0 and analyze last sample
+    w = w / sum(w)  # normalize analysis window
+    pfreq, pmag, pphase, counts = parallel.map_frames(_peaks_segment, x, w.size, H, nFrames,
+                                                      (w, N, H, fs, t, maxnPeaks), processes)
+    return pfreq, pmag, pphase, np.concatenate(([0], np.cumsum(counts)))
+
+
+@tracing.traced("spectral_analysis")
+def spectral_analysis(x, fs, w, N, H, t, maxnPeaks=None, processes=1):
+    """
+    Spectral peaks of all the frames of a sound, to give to several analysis functions
+    x: input sound, fs: sampling rate, w: analysis window, N: FFT size, H: hop size, t: threshold in negative dB
+    maxnPeaks: maximum number of peaks of every frame (None: all peaks above the threshold)
+    processes: number of processes (None: one per cpu)
+    returns SpectralAnalysis
+    """
+
+    hM1 = int(math.floor((w.size + 1) / 2))  # half analysis window size by rounding
+    hM2 = int(math.floor(w.size / 2))  # half analysis window size by floor
+    xp = np.concatenate((np.zeros(hM2), x, np.zeros(hM2)))  # center first window at sample 0 and analyze last sample
+    nFrames = max((xp.size - 2 * hM1) // H + 1, 0)  # frames whose center lies between hM1 and xp.size-hM1 (included)
+    pfreq, pmag, pphase, counts = parallel.map_frames(_peaks_segment, xp, w.size, H, nFrames,
+                                                      (w / sum(w), N, H, fs, t, maxnPeaks), processes)
+    return SpectralAnalysis(x, fs, w, N, H, t, maxnPeaks, pfreq, pmag, pphase, np.concatenate(([0], np.cumsum(counts))))
@@ -2,13 +2,16 @@
 # (for example usage check the examples models_interface)
 
 import sineModel
+import spectralAnalysis
+import tracing
 import utilFunctions
 
 
+@tracing.traced("spr_model_anal")
 def spr_model_anal(x, fs, w, N, H, t, minSineDur, maxnSines, freqDevOffset, freqDevSlope):
     """
     Analysis of a sound using the sinusoidal plus residual model
-    x: input sound, fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
+    x: input sound (or spectralAnalysis.SpectralAnalysis of the sound), fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
     minSineDur: minimum duration of sinusoidal tracks
     maxnSines: maximum number of parallel sinusoids
     freqDevOffset: frequency deviation allowed in the sinusoids from frame to frame at frequency 0
@@ -19,7 +22,7 @@ def spr_model_anal(x, fs, w, N, H, t, minSineDur, maxnSines, freqDevOffset, freq
     # perform sinusoidal analysis
     tfreq, tmag, tphase = sineModel.sine_model_anal(x, fs, w, N, H, t, maxnSines, minSineDur, freqDevOffset, freqDevSlope)
     Ns = 512
-    xr = utilFunctions.sineSubtraction(x, Ns, H, tfreq, tmag, tphase, fs)  # subtract sinusoids from original sound
+    xr = utilFunctions.sineSubtraction(spectralAnalysis.signal(x), Ns, H, tfreq, tmag, tphase, fs)  # subtract sinusoids from original sound
     return tfreq, tmag, tphase, xr
 
 
@@ -4,12 +4,15 @@
 import utilFunctions
 import sineModel
 import stochasticModel
+import spectralAnalysis
+import tracing
 
 
+@tracing.traced("sps_model_anal")
 def sps_model_anal(x, fs, w, N, H, t, minSineDur, maxnSines, freqDevOffset, freqDevSlope, stocf):
     """
     Analysis of a sound using the sinusoidal plus stochastic model
-    x: input sound, fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
+    x: input sound (or spectralAnalysis.SpectralAnalysis of the sound), fs: sampling rate, w: analysis window; N: FFT size, t: threshold in negative dB,
     minSineDur: minimum duration of sinusoidal tracks
     maxnSines: maximum number of parallel sinusoids
     freqDevOffset: frequency deviation allowed in the sinusoids from frame to frame at frequency 0
@@ -21,7 +24,7 @@ def sps_model_anal(x, fs, w, N, H, t, minSineDur, maxnSines, freqDevOffset, freq
     # perform sinusoidal analysis
     tfreq, tmag, tphase = sineModel.sine_model_anal(x, fs, w, N, H, t, maxnSines, minSineDur, freqDevOffset, freqDevSlope)
     Ns = 512
-    xr = utilFunctions.sineSubtraction(x, Ns, H, tfreq, tmag, tphase, fs)  # subtract sinusoids from original sound
+    xr = utilFunctions.sineSubtraction(spectralAnalysis.signal(x), Ns, H, tfreq, tmag, tphase, fs)  # subtract sinusoids from original sound
     stocEnv = stochasticModel.stochastic_model_anal(xr, H, H * 2, stocf)  # compute stochastic model of residual
     return tfreq, tmag, tphase, stocEnv
 
@@ -2,14 +2,66 @@
 # (for example usage check stft_function.py in the models_interface directory)
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 import math
 import dftModel
+import parallel
+import utilFunctions
 
+FRAME_BLOCK = utilFunctions.FRAME_BLOCK  # number of frames transformed together by the batched functions
 
-def stft(x, w, N, H):
+
+def frame_view(x, M, H, nFrames=None):
+    """
+    View of a sound as a matrix of overlapping frames, without copying any sample
+    x: input array sound, M: frame size, H: hop size, nFrames: number of frames (default: all complete frames)
+    returns xframes: read-only array with one frame per row
+    """
+
+    if H <= 0:  # raise error if hop size 0 or negative
+        raise ValueError("Hop size (H) smaller or equal to 0")
+
+    x = np.ascontiguousarray(x)
+    if nFrames is None:  # use every frame that fits completely in the sound
+        nFrames = (x.size - M) // H + 1
+    nFrames = max(nFrames, 0)
+    if nFrames > 0 and (nFrames - 1) * H + M > x.size:  # raise error if last frame falls outside the sound
+        raise ValueError("Sound too short for the requested number of frames")
+    return as_strided(x, shape=(nFrames, M), strides=(H * x.strides[0], x.strides[0]), writeable=False)
+
+
+def _pad(x, before, after, dtype=np.float64):
+    """
+    Copy of a sound with zeros added at both ends, made with a single allocation
+    x: input array sound, before, after: number of zeros to add, dtype: type of the output
+    returns xp: padded sound
+    """
+
+    xp = np.zeros(before + x.size + after, dtype=dtype)
+    xp[before:before + x.size] = x
+    return xp
+
+
+def overlap_add(y, yframes, H, pout=0):
+    """
+    Overlap-add a matrix of frames into a sound with one scatter-add
+    y: output array sound (modified in place), yframes: frames to add (one frame per row)
+    H: hop size, pout: position in y of the first sample of the first frame
+    """
+
+    nFrames, M = yframes.shape
+    if nFrames == 0:  # nothing to add
+        return
+    span = (nFrames - 1) * H + M  # number of output samples covered by the frames
+    index = (H * np.arange(nFrames))[:, np.newaxis] + np.arange(M)  # output position of every frame sample
+    y[pout:pout + span] += np.bincount(index.ravel(), weights=yframes.ravel(), minlength=span)
+
+
+def stft(x, w, N, H, dtype=np.float64):
     """
     Analysis/synthesis of a sound using the short-time Fourier transform
     x: input sound, w: analysis window, N: FFT size, H: hop size
+    dtype: precision, np.float64 or np.float32 (see dftModel for the accuracy of float32)
     returns y: output sound
     """
 
@@ -19,76 +71,166 @@ def stft(x, w, N, H):
     M = w.size  # size of analysis window
     hM1 = int(math.floor((M + 1) / 2))  # half analysis window size by rounding
     hM2 = int(math.floor(M / 2))  # half analysis window size by floor
-    x = np.append(np.zeros(hM2), x)  # add zeros at beginning to center first window at sample 0
-    x = np.append(x, np.zeros(hM1))  # add zeros at the end to analyze last sample
-    pin = hM1  # initialize sound pointer in middle of analysis window
-    pend = x.size - hM1  # last sample to start a frame
-    w = w / sum(w)  # normalize analysis window
-    y = np.zeros(x.size)  # initialize output array
-    while pin <= pend:  # while sound pointer is smaller than last sample
-        # -----analysis-----
-        x1 = x[pin - hM1:pin + hM2]  # select one frame of input sound
-        mX, pX = dftModel.dft_anal(x1, w, N)  # compute dft
-        # -----synthesis-----
-        y1 = dftModel.dft_synth(mX, pX, M)  # compute idft
-        y[pin - hM1:pin + hM2] += H * y1  # overlap-add to generate output sound
-        pin += H  # advance sound pointer
-    y = np.delete(y, range(hM2))  # delete half of first window which was added in stftAnal
-    y = np.delete(y, range(y.size - hM1, y.size))  # delete half of the last window which as added in stftAnal
-    return y
-
-
-def stft_anal(x, w, N, H):
+    x = _pad(x, hM2, hM1, dtype)  # center first window at sample 0 and analyze last sample
+    nFrames = max((x.size - 2 * hM1) // H + 1, 0)  # frames whose center lies between hM1 and x.size-hM1
+    xframes = frame_view(x, M, H, nFrames)  # all frames as a strided view
+    plan = dftModel.DFTPlan(w, N, dtype)  # window and buffers shared by all frames
+    y = np.zeros(x.size, dtype=dtype)  # initialize output array
+    for b in range(0, nFrames, FRAME_BLOCK):  # process the frames in blocks to bound temporary memory
+        e = min(b + FRAME_BLOCK, nFrames)
+        mX, pX = plan.anal_frames(xframes[b:e])  # -----analysis-----
+        y1 = dftModel.dft_synth_frames(mX, pX, M, dtype)  # -----synthesis-----
+        overlap_add(y, H * y1, H, b * H)  # overlap-add to generate output sound
+    return y[hM2:y.size - hM1]  # delete half of the first and last windows which were added for the analysis
+
+
+def _anal_blocks(plan, xframes):
+    """
+    Magnitude and phase spectra of a matrix of frames, transformed in blocks to bound temporary memory
+    plan: DFTPlan of the analysis, xframes: frames (one frame per row)
+    returns xmX, xpX: magnitude and phase spectra (one spectrum per row)
+    """
+
+    nFrames = xframes.shape[0]
+    xmX = np.empty((nFrames, plan.hN), dtype=plan.dtype)  # output magnitude spectra
+    xpX = np.empty((nFrames, plan.hN), dtype=plan.dtype)  # output phase spectra
+    for b in range(0, nFrames, FRAME_BLOCK):
+        e = min(b + FRAME_BLOCK, nFrames)
+        xmX[b:e], xpX[b:e] = plan.anal_frames(xframes[b:e])
+    return xmX, xpX
+
+
+def _stft_anal_segment(x, nFrames, w, N, H, dtype):
+    """
+    Spectra of the first nFrames frames of a padded sound, also run on segments by parallel.map_frames
+    """
+
+    return _anal_blocks(dftModel.DFTPlan(w, N, dtype), frame_view(x, w.size, H, nFrames))
+
+
+def stft_anal(x, w, N, H, dtype=np.float64, processes=1):
     """
     Analysis of a sound using the short-time Fourier transform
     x: input array sound, w: analysis window, N: FFT size, H: hop size
+    dtype: precision of the computation and of the spectra, np.float64 or np.float32 (half the memory)
+    processes: number of processes analyzing segments of the sound in parallel (None: one per cpu)
     returns xmX, xpX: magnitude and phase spectra
     """
 
-
     if H <= 0:  # raise error if hop size 0 or negative
         raise ValueError("Hop size (H) smaller or equal to 0")
 
     M = w.size  # size of analysis window
     hM1 = int(math.floor((M + 1) / 2))  # half analysis window size by rounding
     hM2 = int(math.floor(M / 2))  # half analysis window size by floor
-    x = np.append(np.zeros(hM2), x)  # add zeros at beginning to center first window at sample 0
-    x = np.append(x, np.zeros(hM2))  # add zeros at the end to analyze last sample
-    pin = hM1  # initialize sound pointer in middle of analysis window
-    pend = x.size - hM1  # last sample to start a frame
-    w = w / sum(w)  # normalize analysis window
-
-    xmX = None
-    xpX = None
-
-    while pin <= pend:  # while sound pointer is smaller than last sample
-        x1 = x[pin - hM1:pin + hM2]  # select one frame of input sound
-        mX, pX = dftModel.dft_anal(x1, w, N)  # compute dft
-        if pin == hM1:  # if first frame create output arrays
-            xmX = np.array([mX])
-            xpX = np.array([pX])
-        else:  # append output to existing array
-            xmX = np.vstack((xmX, np.array([mX])))
-            xpX = np.vstack((xpX, np.array([pX])))
-        pin += H  # advance sound pointer
-    return xmX, xpX
+    x = _pad(x, hM2, hM2, dtype)  # center first window at sample 0 and analyze last sample
+    nFrames = (x.size - 2 * hM1) // H + 1  # frames whose center lies between hM1 and x.size-hM1
+    if nFrames <= 0:  # sound shorter than one frame
+        return None, None
+
+    return parallel.map_frames(_stft_anal_segment, x, M, H, nFrames, (w, N, H, dtype), processes)
 
 
-def stft_synth(mY, pY, M, H):
+def stft_synth(mY, pY, M, H, dtype=np.float64):
     """
     Synthesis of a sound using the short-time Fourier transform
     mY: magnitude spectra, pY: phase spectra, M: window size, H: hop-size
+    dtype: precision, np.float64 or np.float32
     returns y: output sound
     """
     hM1 = int(math.floor((M + 1) / 2))  # half analysis window size by rounding
     hM2 = int(math.floor(M / 2))  # half analysis window size by floor
     nFrames = mY[:, 0].size  # number of frames
-    y = np.zeros(nFrames * H + hM1 + hM2)  # initialize output array
-    pin = hM1
-    for i in range(nFrames):  # iterate over all frames
-        y1 = dftModel.dft_synth(mY[i, :], pY[i, :], M)  # compute idft
-        y[pin - hM1:pin + hM2] += H * y1  # overlap-add to generate output sound
-        pin += H  # advance sound pointer
-    y = np.delete(y, range(hM2))  # delete half of first window which was added in stftAnal
-    y = np.delete(y, range(y.size - hM1, y.size))  # delete the end of the sound that was added in stftAnal
-    return y
+    y = np.zeros(nFrames * H + hM1 + hM2, dtype=dtype)  # initialize output array
+    for b in range(0, nFrames, FRAME_BLOCK):  # invert the frames in blocks to bound temporary memory
+        e = min(b + FRAME_BLOCK, nFrames)
+        y1 = dftModel.dft_synth_frames(mY[b:e], pY[b:e], M, dtype)  # compute idft of all frames in the block
+        overlap_add(y, H * y1, H, b * H)  # overlap-add to generate output sound
+    return y[hM2:y.size - hM1]  # delete half of the first and last windows which were added in stftAnal
+
+
+class FrameStream(object):
+    """
+    Split a sound given in blocks of arbitrary size into the analysis frames of stft_anal
+    M: frame size, H: hop size, dtype: type of the frames
+    Only the samples of the frames that are not complete yet are kept between blocks
+    """
+
+    def __init__(self, M, H, dtype=np.float64):
+        if H <= 0:  # raise error if hop size 0 or negative
+            raise ValueError("Hop size (H) smaller or equal to 0")
+
+        self.M = M  # frame size
+        self.H = H  # hop size
+        self.hM1 = int(math.floor((M + 1) / 2))  # half analysis window size by rounding
+        self.hM2 = int(math.floor(M / 2))  # half analysis window size by floor
+        self.dtype = dtype
+        self.buffer = np.zeros(self.hM2, dtype=dtype)  # pending samples, starting with zeros to center first window
+        self.closed = False  # set by flush at the end of the stream
+
+    def _pop(self, nFrames):
+        """
+        Take the next nFrames frames out of the buffer
+        """
+
+        nFrames = max(nFrames, 0)
+        xframes = frame_view(self.buffer, self.M, self.H, nFrames)  # the frames keep the current buffer alive
+        self.buffer = self.buffer[nFrames * self.H:]  # drop the samples no other frame needs
+        return xframes
+
+    def push(self, x):
+        """
+        Add a block of samples
+        x: block of samples of any size
+        returns xframes: frames completed by this block (one frame per row, possibly none)
+        """
+
+        if self.closed:  # raise error if the stream already ended
+            raise ValueError("Stream already flushed")
+
+        self.buffer = _pad(self.buffer, 0, x.size, self.dtype)  # append the block after the pending samples
+        self.buffer[self.buffer.size - x.size:] = x
+        return self._pop((self.buffer.size - self.M) // self.H + 1)
+
+    def flush(self):
+        """
+        End the stream, adding zeros at the end to analyze the last sample
+        returns xframes: remaining frames (one frame per row, possibly none)
+        """
+
+        if self.closed:  # raise error if the stream already ended
+            raise ValueError("Stream already flushed")
+
+        self.closed = True
+        self.buffer = _pad(self.buffer, 0, self.hM2, self.dtype)  # add zeros at the end to analyze last sample
+        return self._pop((self.buffer.size - 2 * self.hM1) // self.H + 1)
+
+
+class STFTStream(object):
+    """
+    Streaming analysis of a sound using the short-time Fourier transform
+    w: analysis window, N: FFT size, H: hop size, dtype: precision, np.float64 or np.float32
+    Pushing all the blocks of a sound and then flushing gives the same spectra as stft_anal on the
+    whole sound, while memory stays bounded by the block size plus one window
+    """
+
+    def __init__(self, w, N, H, dtype=np.float64):
+        self.frames = FrameStream(w.size, H, dtype)  # splits the blocks into frames
+        self.plan = dftModel.DFTPlan(w, N, dtype)  # window and buffers shared by all frames
+
+    def push(self, x):
+        """
+        Add a block of samples
+        x: block of samples of any size
+        returns mX, pX: magnitude and phase spectra of the frames completed by this block
+        """
+
+        return _anal_blocks(self.plan, self.frames.push(x))
+
+    def flush(self):
+        """
+        End the stream
+        returns mX, pX: magnitude and phase spectra of the remaining frames
+        """
+
+        return _anal_blocks(self.plan, self.frames.flush())
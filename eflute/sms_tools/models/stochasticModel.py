@@ -3,15 +3,42 @@
 
 import numpy as np
 from scipy.signal import hanning, resample
-from scipy.fftpack import fft, ifft
+from scipy.fftpack import ifft
 import utilFunctions as UF
+import parallel
+import stft
+import tracing
 
 
-def stochastic_model_anal(x, H, N, stocf):
+def _stochastic_anal_segment(x, nFrames, H, N, stocf):
+    """
+    Stochastic envelopes of the first nFrames frames of a padded sound, also run on segments by parallel.map_frames
+    """
+
+    hN = N / 2 + 1  # positive size of fft
+    w = hanning(N)  # analysis window
+    tracer = tracing.active()  # stage functions are only wrapped if tracing is enabled
+    rfft = tracing.timed(tracer, "fft", np.fft.rfft)
+    decimate = tracing.timed(tracer, "resample", resample)
+    xframes = stft.frame_view(x, N, H, nFrames)  # all frames as a strided view
+    stocEnv = np.empty((nFrames, int(stocf * hN)))  # output stochastic envelopes
+    for b in range(0, nFrames, stft.FRAME_BLOCK):  # transform the frames in blocks to bound temporary memory
+        e = min(b + stft.FRAME_BLOCK, nFrames)
+        X = rfft(xframes[b:e] * w, axis=1)  # compute FFT of the windowed frames
+        mX = 20 * np.log10(abs(X))  # magnitude spectra of positive frequencies
+        stocEnv[b:e] = decimate(np.maximum(-200, mX), stocEnv.shape[1], axis=1)  # decimate the mag spectra
+    if tracer:
+        tracer.count("stochastic_model_anal", nFrames)
+    return stocEnv
+
+
+@tracing.traced("stochastic_model_anal")
+def stochastic_model_anal(x, H, N, stocf, processes=1):
     """
     Stochastic analysis of a sound
     x: input array sound, H: hop size, N: fftsize
     stocf: decimation factor of mag spectrum for stochastic analysis, bigger than 0, maximum of 1
+    processes: number of processes analyzing segments of the sound in parallel (None: one per cpu)
     returns stocEnv: stochastic envelope
     """
 
@@ -29,24 +56,9 @@ def stochastic_model_anal(x, H, N, stocf):
     if not (UF.isPower2(N)):  # raise error if N not a power of two
         raise ValueError("FFT size (N) is not a power of 2")
 
-    w = hanning(N)  # analysis window
-    x = np.append(np.zeros(No2), x)  # add zeros at beginning to center first window at sample 0
-    x = np.append(x, np.zeros(No2))  # add zeros at the end to analyze last sample
-    pin = No2  # initialize sound pointer in middle of analysis window
-    pend = x.size - No2  # last sample to start a frame
-
-    stocEnv = None
-    while pin <= pend:
-        xw = x[pin - No2:pin + No2] * w  # window the input sound
-        X = fft(xw)  # compute FFT
-        mX = 20 * np.log10(abs(X[:hN]))  # magnitude spectrum of positive frequencies
-        mY = resample(np.maximum(-200, mX), stocf * hN)  # decimate the mag spectrum
-        if pin == No2:  # first frame
-            stocEnv = np.array([mY])
-        else:  # rest of frames
-            stocEnv = np.vstack((stocEnv, np.array([mY])))
-        pin += H  # advance sound pointer
-    return stocEnv
+    x = np.concatenate((np.zeros(No2), x, np.zeros(No2)))  # center first window at sample 0 and analyze last sample
+    nFrames = (x.size - N) // H + 1  # frames whose center lies between No2 and x.size-No2
+    return parallel.map_frames(_stochastic_anal_segment, x, N, H, nFrames, (H, N, stocf), processes)
 
 
 def stochastic_model_synth(stocEnv, H, N):
@@ -0,0 +1,117 @@
+# opt-in instrumentation of the analysis loops of the models
+# (per-stage cumulative time and call counts, frames and peaks per model)
+#
+# Usage:
+#     with tracing.Tracer() as tracer:
+#         harmonicModel.harmonic_model_anal(x, fs, w, N, H, t, nH, minf0, maxf0, f0et)
+#     report = tracer.report()
+# or Tracer(callback) to receive the report when the block ends, e.g. to export it to a metrics system.
+#
+# When no tracer is active the loops call the original functions directly, so the only cost is one
+# lookup per analysis call. Stages that run in other processes (processes > 1) are not reported.
+
+import functools
+import timeit
+
+_active = None  # tracer collecting the measures, None when tracing is disabled
+
+
+def active():
+    """
+    Tracer collecting the measures, or None when tracing is disabled
+    """
+
+    return _active
+
+
+class Tracer(object):
+    """
+    Collect the time and number of calls of every stage of the analysis functions run while it is active
+    callback: function called with the report when the tracer is deactivated (optional)
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = {}  # stage name: [number of calls, cumulative time in seconds]
+        self.frames = {}  # model name: number of frames analyzed
+        self.peaks = {}  # model name: number of spectral peaks found
+        self._previous = None
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = self._previous
+        if self.callback is not None:
+            self.callback(self.report())
+        return False
+
+    def add(self, stage, seconds, calls=1):
+        """
+        Add the time of calls of a stage
+        """
+
+        measure = self.stages.setdefault(stage, [0, 0.0])
+        measure[0] += calls
+        measure[1] += seconds
+
+    def count(self, model, frames=1, peaks=0):
+        """
+        Count frames and peaks analyzed by a model
+        """
+
+        self.frames[model] = self.frames.get(model, 0) + frames
+        self.peaks[model] = self.peaks.get(model, 0) + peaks
+
+    def report(self):
+        """
+        returns dict with, for every stage, its number of calls and cumulative time,
+        and for every model, its frames, frames per second and peaks per frame
+        """
+
+        stages = dict((name, {"calls": calls, "time": seconds}) for name, (calls, seconds) in self.stages.items())
+        models = {}
+        for model, frames in self.frames.items():
+            seconds = self.stages.get(model, [0, 0.0])[1]
+            models[model] = {"frames": frames,
+                             "frames_per_second": frames / seconds if seconds > 0 else 0.0,
+                             "peaks_per_frame": self.peaks[model] / float(frames) if frames > 0 else 0.0}
+        return {"stages": stages, "models": models}
+
+
+def timed(tracer, stage, func):
+    """
+    Function to call in an analysis loop for one stage
+    tracer: active tracer or None, stage: name of the stage, func: function of the stage
+    returns func itself when tracer is None, otherwise func adding its time to the tracer
+    """
+
+    if tracer is None:
+        return func
+
+    def timed_func(*args, **kwargs):
+        start = timeit.default_timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            tracer.add(stage, timeit.default_timer() - start)
+
+    return timed_func
+
+
+def traced(stage):
+    """
+    Decorator that adds the time of every call of a model function to the active tracer, if any
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return timed(_active, stage, func)(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -9,4 +9,20 @@
 """
 from __future__ import print_function, absolute_import, division
 
+import numpy as np
 import pytest
+
+
+@pytest.fixture
+def sound():
+    """
+    Test sound: harmonics of f0 with amplitudes 0.5/h, plus white noise
+    returns function sound(size, f0, harmonics, noise, fs) generating the sound
+    """
+
+    def _sound(size=20000, f0=440, harmonics=1, noise=0.01, fs=44100):
+        rng = np.random.RandomState(0)
+        t = np.arange(size) / float(fs)
+        return sum(0.5 / h * np.sin(2 * np.pi * f0 * h * t) for h in range(1, harmonics + 1)) + noise * rng.randn(size)
+
+    return _sound
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import corpus, harmonicModel, utilFunctions
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+PARAMS = {"N": 2048, "H": 256, "t": -80, "nH": 20, "minf0": 100, "maxf0": 1500, "f0et": 5}
+
+
+def test_corpus_files():
+    files = corpus.corpus_files([os.path.join(DATA_DIR, "Sopran"), os.path.join(DATA_DIR, "flute_tone.wav")])
+    assert len(files) == 10
+    assert files[0].endswith("a4.wav") and files[-1].endswith("flute_tone.wav")
+    assert corpus.corpus_files(os.path.join(DATA_DIR, "Flute")) == corpus.corpus_files([os.path.join(DATA_DIR, "Flute")])
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_corpus(processes, tmpdir):
+    bad = tmpdir.join("bad.wav")
+    bad.write("not a wav file")
+    files = [os.path.join(DATA_DIR, "Flute", name) for name in ["a4.wav", "c5.wav", "g5.wav"]] + [str(bad)]
+    w = get_window("blackman", 1201)
+    results = list(corpus.run_corpus(files, "harmonic", w, PARAMS, processes=processes))
+    assert sorted(r["file"] for r in results) == sorted(files)
+    for r in results:
+        assert r["time"] > 0
+        if r["file"] == str(bad):
+            assert r["result"] is None and r["error"]
+            continue
+        assert r["error"] is None
+        wav = utilFunctions.WavFile(r["file"])
+        expected = harmonicModel.harmonic_model_anal(wav.read(channel=0), wav.fs, w, **PARAMS)
+        for a, b in zip(r["result"], expected):
+            assert np.array_equal(a, b)
+
+
+def test_run_corpus_errors():
+    w = get_window("blackman", 1201)
+    with pytest.raises(ValueError):
+        corpus.run_corpus(DATA_DIR, "unknown", w, PARAMS)
+    with pytest.raises(TypeError):
+        corpus.run_corpus(DATA_DIR, "sine", w, PARAMS)
+    assert corpus._state is None  # the calling process is not set up as a worker
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import dftModel
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+
+def test_plan_reused_across_frames():
+    rng = np.random.RandomState(0)
+    w = get_window("blackman", 801)
+    plan = dftModel.DFTPlan(w, 1024)
+    for _ in range(3):
+        x = rng.randn(801)
+        mX, pX = plan.anal(x)
+        rmX, rpX = dftModel.dft_anal(x, w, 1024)
+        assert np.array_equal(mX, rmX)
+        assert np.array_equal(pX, rpX)
+
+
+def test_plans_shared_by_calls():
+    rng = np.random.RandomState(0)
+    w = get_window("blackman", 801)
+    dftModel.dft_anal(rng.randn(801), w, 1024)
+    plan = dftModel._plans.values()[-1]
+    dftModel.dft_anal_frames(rng.randn(3, 801), w.copy(), 1024)
+    assert dftModel._plans.values()[-1] is plan  # same window, FFT size and precision
+    dftModel.dft_anal(rng.randn(801), w, 2048)
+    dftModel.dft_anal(rng.randn(801), w, 1024, np.float32)
+    assert len(set(dftModel._plans.values()[-3:])) == 3
+    for i in range(dftModel.PLAN_CACHE_SIZE):
+        dftModel.dft_anal(rng.randn(800 - i), get_window("hann", 800 - i), 1024)
+    assert len(dftModel._plans) == dftModel.PLAN_CACHE_SIZE and plan not in dftModel._plans.values()
+
+
+def test_plan_anal_frames():
+    rng = np.random.RandomState(0)
+    w = get_window("hamming", 512)
+    plan = dftModel.DFTPlan(w, 512)
+    xframes = rng.randn(5, 512)
+    mX, pX = plan.anal_frames(xframes)
+    for i in range(5):
+        rmX, rpX = plan.anal(xframes[i])
+        assert np.allclose(mX[i], rmX, atol=1e-8)
+        assert np.allclose(pX[i], rpX, atol=1e-8)
+
+
+def test_plan_errors():
+    with pytest.raises(ValueError):
+        dftModel.DFTPlan(np.ones(100), 1000)
+    with pytest.raises(ValueError):
+        dftModel.DFTPlan(np.ones(1025), 1024)
+
+
+def test_float32_precision():
+    rng = np.random.RandomState(0)
+    w = get_window("hamming", 1001)
+    x = rng.randn(1001)
+    mX, pX = dftModel.dft_anal(x, w, 2048)
+    mX32, pX32 = dftModel.dft_anal(x, w, 2048, np.float32)
+    assert mX32.dtype == np.float32
+    assert pX32.dtype == np.float32
+    assert np.allclose(mX32, mX, atol=1e-3)
+    y = dftModel.dft_synth(mX, pX, 1001)
+    y32 = dftModel.dft_synth(mX32, pX32, 1001, np.float32)
+    assert y32.dtype == np.float32
+    assert np.allclose(y32, y, atol=1e-5 * np.abs(y).max())
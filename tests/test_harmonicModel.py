@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import harmonicModel
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+
+def _harmonic_detection_reference(pfreq, pmag, pphase, f0, nH, hfreqp, fs, harmDevSlope=0.01):
+    if f0 <= 0:
+        return np.zeros(nH), np.zeros(nH), np.zeros(nH)
+    hfreq = np.zeros(nH)
+    hmag = np.zeros(nH) - 100
+    hphase = np.zeros(nH)
+    hf = f0 * np.arange(1, nH + 1)
+    hi = 0
+    if len(hfreqp) == 0:
+        hfreqp = hf
+    while (f0 > 0) and (hi < nH) and (hf[hi] < fs / 2):
+        pei = np.argmin(abs(pfreq - hf[hi]))
+        dev1 = abs(pfreq[pei] - hf[hi])
+        dev2 = (abs(pfreq[pei] - hfreqp[hi]) if hfreqp[hi] > 0 else fs)
+        threshold = f0 / 3 + harmDevSlope * pfreq[pei]
+        if ((dev1 < threshold) or (dev2 < threshold)):
+            hfreq[hi] = pfreq[pei]
+            hmag[hi] = pmag[pei]
+            hphase[hi] = pphase[pei]
+        hi += 1
+    return hfreq, hmag, hphase
+
+
+def _peaks(nFrames=300, seed=0):
+    rng = np.random.RandomState(seed)
+    f0 = np.where(rng.rand(nFrames) < 0.9, 100 + 20 * np.sin(np.arange(nFrames) / 20.0), 0)
+    pfreq, counts = [], []
+    for l in range(nFrames):
+        # inharmonic partials drifting from the harmonic series, and noise peaks
+        freq = np.concatenate((np.arange(1, 80) * 100 * (1 + 0.004 * np.sin(l / 7.0)) + 8 * rng.randn(79),
+                               rng.uniform(20, 21000, rng.randint(0, 30))))
+        freq = np.unique(freq[(freq > 0) & (rng.rand(freq.size) < 0.8)])
+        pfreq.append(freq)
+        counts.append(freq.size)
+    pfreq = np.concatenate(pfreq)
+    return (pfreq, -80 * rng.rand(pfreq.size), rng.uniform(-np.pi, np.pi, pfreq.size),
+            np.concatenate(([0], np.cumsum(counts))), f0)
+
+
+def test_harmonic_detection_matches_reference():
+    pfreq, pmag, pphase, offsets, f0 = _peaks(50)
+    hfreqp = []
+    for l in range(50):
+        b, e = offsets[l], offsets[l + 1]
+        result = harmonicModel.harmonic_detection(pfreq[b:e], pmag[b:e], pphase[b:e], f0[l], 100, hfreqp, 44100)
+        expected = _harmonic_detection_reference(pfreq[b:e], pmag[b:e], pphase[b:e], f0[l], 100, hfreqp, 44100)
+        for a, r in zip(result, expected):
+            assert np.array_equal(a, r)
+        hfreqp = result[0]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_harmonic_detection_frames(seed):
+    pfreq, pmag, pphase, offsets, f0 = _peaks(seed=seed)
+    hfreq, hmag, hphase = harmonicModel.harmonic_detection_frames(pfreq, pmag, pphase, offsets, f0, 100, 22050)
+    hfreqp = []
+    for l in range(f0.size):
+        b, e = offsets[l], offsets[l + 1]
+        expected = _harmonic_detection_reference(pfreq[b:e], pmag[b:e], pphase[b:e], f0[l], 100, hfreqp, 22050)
+        for a, r in zip((hfreq[l], hmag[l], hphase[l]), expected):
+            assert np.array_equal(a, r)
+        hfreqp = expected[0]
+
+
+def test_harmonic_model_anal():
+    fs = 44100
+    t = np.arange(20000) / float(fs)
+    x = sum(0.5 / h * np.sin(2 * np.pi * 220 * h * t) for h in range(1, 8))
+    w = get_window("blackman", 1201)
+    hfreq, hmag, hphase = harmonicModel.harmonic_model_anal(x, fs, w, 2048, 256, -80, 10, 100, 1000, 5)
+    assert hfreq.shape == (20000 // 256 + 1, 10)
+    assert np.allclose(hfreq[5:-5, :7], 220 * np.arange(1, 8), atol=1)
+    f0 = harmonicModel.f0_detection(x, fs, w, 2048, 256, -80, 100, 1000, 5)
+    assert np.allclose(f0[5:-5], 220, atol=1)
+
+
+def test_f0_decimation():
+    assert harmonicModel.f0_decimation(44100, 4096, 256, 1500) == 1
+    assert harmonicModel.f0_decimation(44100, 4096, 256, 480) == 4
+    assert harmonicModel.f0_decimation(44100, 4096, 2, 100) == 2
+
+
+@pytest.mark.parametrize("M,N,decimation", [(1201, 2048, None), (2001, 4096, 2), (1024, 4096, 8)])
+def test_f0_detection_multires(M, N, decimation):
+    fs = 44100
+    rng = np.random.RandomState(0)
+    t = np.arange(30000) / float(fs)
+    phase = 2 * np.pi * np.cumsum(220 + 5 * np.sin(2 * np.pi * 5 * t)) / fs  # vibrato
+    x = sum(0.5 / h * np.sin(h * phase) for h in range(1, 8)) + 0.001 * rng.randn(t.size)
+    x[10000:14000] = 0.001 * rng.randn(4000)  # unvoiced frames
+    w = get_window("blackman", M)
+    f0 = harmonicModel.f0_detection(x, fs, w, N, 256, -80, 100, 400, 5)
+    mf0 = harmonicModel.f0_detection_multires(x, fs, w, N, 256, -80, 100, 400, 5, decimation)
+    assert mf0.shape == f0.shape
+    assert np.array_equal(mf0 > 0, f0 > 0)
+    assert np.allclose(mf0, f0, rtol=1e-6)
+
+
+def test_f0_detection_multires_errors():
+    x = np.zeros(5000)
+    w = get_window("blackman", 1201)
+    with pytest.raises(ValueError):
+        harmonicModel.f0_detection_multires(x, 44100, w, 2048, 250, -80, 100, 400, 5, 4)
+    with pytest.raises(ValueError):
+        harmonicModel.f0_detection_multires(x, 44100, w, 2048, 256, -80, 100, 3000, 5, 8)
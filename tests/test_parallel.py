@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import parallel, sineModel, stft, stochasticModel
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+
+def test_frame_segments():
+    assert parallel.frame_segments(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert parallel.frame_segments(2, 8) == [(0, 1), (1, 2)]
+
+
+def test_parallel_stft_anal(sound):
+    x = sound(30000, harmonics=2)
+    w = get_window("hamming", 1001)
+    serial = stft.stft_anal(x, w, 2048, 256)
+    for a, b in zip(serial, stft.stft_anal(x, w, 2048, 256, processes=3)):
+        assert np.array_equal(a, b)
+
+
+def test_parallel_stochastic_model_anal(sound):
+    x = sound(30000, harmonics=2)
+    serial = stochasticModel.stochastic_model_anal(x, 128, 256, 0.2)
+    assert np.array_equal(serial, stochasticModel.stochastic_model_anal(x, 128, 256, 0.2, processes=3))
+
+
+def test_parallel_sine_model_anal(sound):
+    x = sound(30000, harmonics=2)
+    w = get_window("blackman", 1201)
+    serial = sineModel.sine_model_anal(x, 44100, w, 2048, 256, -80)
+    for a, b in zip(serial, sineModel.sine_model_anal(x, 44100, w, 2048, 256, -80, processes=3)):
+        assert np.array_equal(a, b)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy.fftpack import fftshift, ifft
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import sineModel, utilFunctions
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+
+def _sine_tracking_reference(pfreq, pmag, pphase, tfreq, freqDevOffset=20, freqDevSlope=0.01):
+    # previous implementation of sineModel.sine_tracking, with argmin over all free tracks for every peak
+    tfreqn = np.zeros(tfreq.size)
+    tmagn = np.zeros(tfreq.size)
+    tphasen = np.zeros(tfreq.size)
+    pindexes = np.array(np.nonzero(pfreq), dtype=int)[0]
+    incomingTracks = np.array(np.nonzero(tfreq), dtype=int)[0]
+    newTracks = np.zeros(tfreq.size, dtype=int) - 1
+    magOrder = np.argsort(-pmag[pindexes])
+    pfreqt = np.copy(pfreq)
+    pmagt = np.copy(pmag)
+    pphaset = np.copy(pphase)
+    if incomingTracks.size > 0:
+        for i in magOrder:
+            if incomingTracks.size == 0:
+                break
+            track = np.argmin(abs(pfreqt[i] - tfreq[incomingTracks]))
+            freqDistance = abs(pfreq[i] - tfreq[incomingTracks[track]])
+            if freqDistance < (freqDevOffset + freqDevSlope * pfreq[i]):
+                newTracks[incomingTracks[track]] = i
+                incomingTracks = np.delete(incomingTracks, track)
+    indext = np.array(np.nonzero(newTracks != -1), dtype=int)[0]
+    if indext.size > 0:
+        indexp = newTracks[indext]
+        tfreqn[indext] = pfreqt[indexp]
+        tmagn[indext] = pmagt[indexp]
+        tphasen[indext] = pphaset[indexp]
+        pfreqt = np.delete(pfreqt, indexp)
+        pmagt = np.delete(pmagt, indexp)
+        pphaset = np.delete(pphaset, indexp)
+    emptyt = np.array(np.nonzero(tfreq == 0), dtype=int)[0]
+    peaksleft = np.argsort(-pmagt)
+    if ((peaksleft.size > 0) & (emptyt.size >= peaksleft.size)):
+        tfreqn[emptyt[:peaksleft.size]] = pfreqt[peaksleft]
+        tmagn[emptyt[:peaksleft.size]] = pmagt[peaksleft]
+        tphasen[emptyt[:peaksleft.size]] = pphaset[peaksleft]
+    elif ((peaksleft.size > 0) & (emptyt.size < peaksleft.size)):
+        tfreqn[emptyt] = pfreqt[peaksleft[:emptyt.size]]
+        tmagn[emptyt] = pmagt[peaksleft[:emptyt.size]]
+        tphasen[emptyt] = pphaset[peaksleft[:emptyt.size]]
+        tfreqn = np.append(tfreqn, pfreqt[peaksleft[emptyt.size:]])
+        tmagn = np.append(tmagn, pmagt[peaksleft[emptyt.size:]])
+        tphasen = np.append(tphasen, pphaset[peaksleft[emptyt.size:]])
+    return tfreqn, tmagn, tphasen
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_sine_tracking_matches_reference(seed):
+    rng = np.random.RandomState(seed)
+    nPeaks = rng.randint(0, 30)
+    nTracks = rng.randint(0, 30)
+    if seed % 2:  # integer frequencies and magnitudes, to get equal frequencies and equal distances
+        pfreq = rng.randint(1, 200, nPeaks).astype(float)
+        tfreq = rng.randint(1, 200, nTracks).astype(float)
+        pmag = rng.randint(-80, -70, nPeaks).astype(float)
+    else:
+        pfreq = rng.uniform(20, 5000, nPeaks)
+        tfreq = pfreq[rng.randint(0, max(nPeaks, 1), nTracks)] + rng.normal(0, 30, nTracks) if nPeaks else \
+            rng.uniform(20, 5000, nTracks)
+        pmag = rng.uniform(-100, 0, nPeaks)
+    tfreq[rng.rand(nTracks) < 0.3] = 0  # empty tracks
+    pphase = rng.uniform(-np.pi, np.pi, nPeaks)
+    result = sineModel.sine_tracking(pfreq, pmag, pphase, tfreq)
+    expected = _sine_tracking_reference(pfreq, pmag, pphase, tfreq)
+    for a, b in zip(result, expected):
+        assert np.array_equal(a, b)
+
+
+def test_sine_model_anal_tracks():
+    fs = 44100
+    t = np.arange(30000) / float(fs)
+    x = 0.5 * np.sin(2 * np.pi * 440 * t) + 0.3 * np.sin(2 * np.pi * (1000 + 200 * t) * t)
+    w = get_window("blackman", 1201)
+    tfreq, tmag, tphase = sineModel.sine_model_anal(x, fs, w, 2048, 256, -80, maxnSines=10)
+    assert tfreq.shape[1] == 10
+    assert np.allclose(tfreq[10:-10, 0], 440, atol=1)
+
+
+def test_track_store():
+    tracks = sineModel.TrackStore(3, 4)
+    tracks.write(1, np.array([100.0, 200.0]), np.array([-10.0, -20.0]), np.array([0.5, 1.0]))
+    assert tracks.freq.shape == (3, 4)
+    assert np.array_equal(tracks.freq[1], [100, 200, 0, 0])
+    assert np.array_equal(tracks.mag[1], [-10, -20, 0, 0])
+    assert not tracks.freq[[0, 2]].any()
+
+
+def test_sine_model_anal_sparse():
+    fs = 44100
+    t = np.arange(30000) / float(fs)
+    x = 0.5 * np.sin(2 * np.pi * 440 * t) + 0.3 * np.sin(2 * np.pi * (1000 + 200 * t) * t)
+    w = get_window("blackman", 1201)
+    tracks = sineModel.sine_model_anal(x, fs, w, 2048, 256, -80, maxnSines=10, sparse=True)
+    tfreq, tmag, tphase = sineModel.sine_model_anal(x, fs, w, 2048, 256, -80, maxnSines=10)
+    active = tfreq > 0
+    for a, b in zip(tracks.toDense(), (tfreq, tmag * active, tphase * active)):
+        assert np.array_equal(a, b)
+    np.random.seed(0)
+    y = sineModel.sine_model_synth(tracks, None, None, 512, 256, fs)
+    np.random.seed(0)
+    assert np.allclose(y, sineModel.sine_model_synth(tfreq, tmag, tphase, 512, 256, fs), rtol=0, atol=1e-12)
+    xr = utilFunctions.sineSubtraction(x, 512, 256, tracks, None, None, fs)
+    assert np.allclose(xr, utilFunctions.sineSubtraction(x, 512, 256, tfreq, tmag, tphase, fs), rtol=0, atol=1e-12)
+
+
+def test_sine_model_anal_prunes_peaks():
+    fs = 44100
+    t = np.arange(20000) / float(fs)
+    x = 0.5 * np.sin(2 * np.pi * 440 * t) + 0.001 * np.random.RandomState(0).randn(t.size)
+    w = get_window("blackman", 1201)
+    tfreq, tmag, tphase = sineModel.sine_model_anal(x, fs, w, 2048, 256, -120, maxnSines=4, maxnPeaks=4)
+    assert tfreq.shape[1] == 4
+    assert np.allclose(tfreq[5:-5, 0], 440, atol=1)
+
+
+def _sine_model_synth_frame_by_frame(tfreq, tmag, tphase, N, H, fs):
+    hN = N // 2
+    y = np.zeros(H * (tfreq.shape[0] + 3))
+    sw = utilFunctions.synthesisWindow(N, H)
+    lastytfreq = tfreq[0, :]
+    ytphase = 2 * np.pi * np.random.rand(tfreq[0, :].size)
+    for l in range(tfreq.shape[0]):
+        if tphase.size > 0:
+            ytphase = tphase[l, :]
+        else:
+            ytphase += (np.pi * (lastytfreq + tfreq[l, :]) / fs) * H
+        Y = utilFunctions.genSpecSines_p(tfreq[l, :], tmag[l, :], ytphase, N, fs)
+        lastytfreq = tfreq[l, :]
+        ytphase = ytphase % (2 * np.pi)
+        y[l * H:l * H + N] += sw * np.real(fftshift(ifft(Y)))
+    return y[hN:y.size - hN]
+
+
+@pytest.mark.parametrize("phases", [True, False])
+def test_sine_model_synth_matches_frame_by_frame(phases):
+    fs = 44100
+    t = np.arange(30000) / float(fs)
+    x = 0.5 * np.sin(2 * np.pi * 440 * t) + 0.3 * np.sin(2 * np.pi * (1000 + 200 * t) * t)
+    w = get_window("blackman", 1201)
+    tfreq, tmag, tphase = sineModel.sine_model_anal(x, fs, w, 2048, 128, -80, maxnSines=10)
+    if not phases:
+        tphase = np.array([])
+    np.random.seed(0)
+    y = sineModel.sine_model_synth(tfreq, tmag, tphase, 512, 128, fs)
+    np.random.seed(0)
+    assert np.allclose(y, _sine_model_synth_frame_by_frame(tfreq, tmag, tphase, 512, 128, fs), rtol=0, atol=1e-9)
+
+
+def test_sine_model_synth_oscillators():
+    fs, H = 44100, 128
+    tfreq = np.zeros((20, 3))
+    tfreq[:, 0] = 440.0  # steady track
+    tfreq[5:10, 2] = np.linspace(1000, 1100, 5)  # glide starting and ending inside the sound
+    tmag = np.full((20, 3), 20 * np.log10(0.25))
+    tphase = np.full((20, 3), 0.5)
+    y = sineModel.sine_model_synth_oscillators(tfreq, tmag, tphase, H, fs)
+    assert y.size == 20 * H
+    n = np.arange(4 * H)
+    x = 0.5 * np.cos(2 * np.pi * 440 * n / float(fs) + 0.5)
+    assert np.allclose(y[:4 * H], x)  # the glide starts its ramp at frame 4
+    assert np.allclose(y[10 * H:19 * H], 0.5 * np.cos(2 * np.pi * 440 * np.arange(10 * H, 19 * H) / float(fs) + 0.5))
+    np.random.seed(0)
+    yauto = sineModel.sine_model_synth(tfreq, tmag, tphase, 512, H, fs, method="auto")
+    assert yauto.size == 23 * H - 512  # same size as the FFT synthesis
+    assert np.array_equal(yauto, y[:yauto.size])
+
+
+@pytest.mark.parametrize("start", [0, 1, 2])
+def test_sine_model_synth_oscillators_track_phase(start):
+    fs, H = 44100, 128
+    inc = 2 * np.pi * 1000 * H / float(fs)  # phase increment of a hop
+    tfreq = np.zeros((10, 1))
+    tfreq[start:start + 7] = 1000.0
+    tmag = np.zeros((10, 1))
+    tphase = np.where(tfreq > 0, 1 + inc * np.arange(10)[:, np.newaxis], 0)  # phases of a 1 kHz sine
+    y = sineModel.sine_model_synth_oscillators(tfreq, tmag, tphase, H, fs)
+    n = np.arange((start + 1) * H, (start + 6) * H)  # samples after the ramp of the beginning of the track
+    assert np.allclose(y[n], 2 * np.cos(2 * np.pi * 1000 * n / float(fs) + 1))
+
+
+def test_sine_model_synth_method():
+    tfreq = np.full((10, 2), 440.0)
+    with pytest.raises(ValueError):
+        sineModel.sine_model_synth(tfreq, tfreq, tfreq, 512, 128, 44100, method="wavetable")
+
+
+@pytest.mark.parametrize("phases", [True, False])
+def test_sine_synth_stream(phases):
+    rng = np.random.RandomState(1)
+    fs, N, H = 44100, 512, 128
+    tfreq = np.where(rng.rand(300, 5) < 0.7, 200 + 3000 * rng.rand(300, 5), 0)
+    tmag = -20 * rng.rand(300, 5)
+    tphase = rng.uniform(-np.pi, np.pi, (300, 5))
+    np.random.seed(0)
+    y = sineModel.sine_model_synth(tfreq, tmag, tphase if phases else np.array([]), N, H, fs)
+    np.random.seed(0)
+    stream = sineModel.SineSynthStream(N, H, fs)
+    blocks = []
+    for b, e in [(0, 1), (1, 4), (4, 5), (5, 100), (100, 300)]:
+        blocks.append(stream.push(tfreq[b:e], tmag[b:e], tphase[b:e] if phases else None))
+        assert blocks[-1].size == (e - b) * H
+    blocks.append(stream.flush())
+    ystream = np.concatenate(blocks)
+    assert ystream.size == 301 * H
+    assert np.allclose(ystream[H:H + y.size], y, rtol=0, atol=1e-9)
+    with pytest.raises(ValueError):
+        stream.push(tfreq[0], tmag[0])
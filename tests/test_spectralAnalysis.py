@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import harmonicModel, hpsModel, sineModel, spectralAnalysis, spsModel
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+FS, N, H, T = 44100, 2048, 256, -80
+
+
+def _assert_equal(a, b):
+    for u, v in zip(a, b):
+        assert np.array_equal(u, v)
+
+
+def test_models_accept_spectral_analysis(sound):
+    x = sound(f0=220, harmonics=5)
+    w = get_window("blackman", 1201)
+    analysis = spectralAnalysis.spectral_analysis(x, FS, w, N, H, T)
+    _assert_equal(sineModel.sine_model_anal(analysis, FS, w, N, H, T), sineModel.sine_model_anal(x, FS, w, N, H, T))
+    assert np.array_equal(harmonicModel.f0_detection(analysis, FS, w, N, H, T, 100, 1000, 5),
+                          harmonicModel.f0_detection(x, FS, w, N, H, T, 100, 1000, 5))
+    _assert_equal(harmonicModel.harmonic_model_anal(analysis, FS, w, N, H, T, 20, 100, 1000, 5),
+                  harmonicModel.harmonic_model_anal(x, FS, w, N, H, T, 20, 100, 1000, 5))
+    _assert_equal(hpsModel.hps_model_anal(analysis, FS, w, N, H, T, 20, 100, 1000, 5, 0.01, 0.02, 512, 0.2),
+                  hpsModel.hps_model_anal(x, FS, w, N, H, T, 20, 100, 1000, 5, 0.01, 0.02, 512, 0.2))
+    _assert_equal(spsModel.sps_model_anal(analysis, FS, w, N, H, T, 0.02, 50, 20, 0.01, 0.2),
+                  spsModel.sps_model_anal(x, FS, w, N, H, T, 0.02, 50, 20, 0.01, 0.2))
+
+
+def test_spectral_analysis_parameters_checked(sound):
+    x = sound(5000, f0=220, harmonics=5)
+    w = get_window("hamming", 1001)
+    analysis = spectralAnalysis.spectral_analysis(x, FS, w, N, H, T)
+    with pytest.raises(ValueError):
+        sineModel.sine_model_anal(analysis, FS, w, N, 128, T)
+    with pytest.raises(ValueError):
+        harmonicModel.f0_detection(analysis, FS, get_window("blackman", 1001), N, H, T, 100, 1000, 5)
+    with pytest.raises(ValueError):
+        sineModel.sine_model_anal(analysis, FS, w, N, H, T, maxnPeaks=10)
+
+
+def test_spectral_analysis_processes(sound):
+    x = sound(5000, f0=220, harmonics=5)
+    w = get_window("hamming", 1001)
+    analysis = spectralAnalysis.spectral_analysis(x, FS, w, N, H, T, processes=2)
+    serial = spectralAnalysis.spectral_analysis(x, FS, w, N, H, T)
+    assert analysis.nFrames == (x.size + 2 * 500 - 2 * 501) // H + 1
+    for name in ("pfreq", "pmag", "pphase", "offsets"):
+        assert np.array_equal(getattr(analysis, name), getattr(serial, name))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import dftModel, stft
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+
+def _stft_anal_frame_by_frame(x, w, N, H):
+    hM1 = (w.size + 1) // 2
+    hM2 = w.size // 2
+    x = np.append(np.zeros(hM2), x)
+    x = np.append(x, np.zeros(hM2))
+    w = w / sum(w)
+    xmX, xpX = [], []
+    pin = hM1
+    while pin <= x.size - hM1:
+        mX, pX = dftModel.dft_anal(x[pin - hM1:pin + hM2], w, N)
+        xmX.append(mX)
+        xpX.append(pX)
+        pin += H
+    return np.array(xmX), np.array(xpX)
+
+
+@pytest.mark.parametrize("M,N,H", [(1001, 2048, 256), (1024, 1024, 128), (511, 512, 100)])
+def test_stft_anal_matches_frame_by_frame(M, N, H, sound):
+    x = sound()
+    w = get_window("hamming", M)
+    xmX, xpX = stft.stft_anal(x, w, N, H)
+    rmX, rpX = _stft_anal_frame_by_frame(x, w, N, H)
+    assert xmX.shape == rmX.shape
+    assert np.allclose(xmX, rmX, atol=1e-6)
+    assert np.allclose(xpX, rpX, atol=1e-6)
+
+
+def test_frame_view():
+    x = np.arange(10.0)
+    xframes = stft.frame_view(x, 4, 3)
+    assert xframes.shape == (3, 4)
+    assert np.array_equal(xframes[2], [6, 7, 8, 9])
+    assert not xframes.flags.writeable
+    with pytest.raises(ValueError):
+        stft.frame_view(x, 4, 3, 4)
+
+
+def _stft_synth_frame_by_frame(mY, pY, M, H):
+    hM1 = (M + 1) // 2
+    hM2 = M // 2
+    y = np.zeros(mY.shape[0] * H + hM1 + hM2)
+    for i in range(mY.shape[0]):
+        y[i * H:i * H + M] += H * dftModel.dft_synth(mY[i, :], pY[i, :], M)
+    return y[hM2:y.size - hM1]
+
+
+@pytest.mark.parametrize("M,N,H", [(1001, 2048, 256), (511, 512, 100)])
+def test_stft_synth_matches_frame_by_frame(M, N, H, sound):
+    x = sound()
+    w = get_window("hamming", M)
+    xmX, xpX = stft.stft_anal(x, w, N, H)
+    y = stft.stft_synth(xmX, xpX, M, H)
+    assert np.allclose(y, _stft_synth_frame_by_frame(xmX, xpX, M, H), atol=1e-10)
+
+
+def test_stft_identity(sound):
+    x = sound()
+    w = get_window("hamming", 1024)
+    y = stft.stft(x, w, 1024, 256)
+    assert y.size == x.size
+    assert np.allclose(y[1024:-1024], x[1024:-1024], atol=1e-2)
+
+
+def test_overlap_add():
+    y = np.zeros(10)
+    stft.overlap_add(y, np.ones((3, 4)), 2, 1)
+    assert np.array_equal(y, [0, 1, 1, 2, 2, 2, 2, 1, 1, 0])
+
+
+@pytest.mark.parametrize("M,N,H,block", [(1001, 2048, 256, 700), (1024, 1024, 128, 5000), (511, 512, 100, 1)])
+def test_stft_stream_matches_stft_anal(M, N, H, block, sound):
+    x = sound(5000)
+    w = get_window("hamming", M)
+    stream = stft.STFTStream(w, N, H)
+    spectra = [stream.push(x[i:i + block]) for i in range(0, x.size, block)]
+    spectra.append(stream.flush())
+    assert stream.frames.buffer.size < M
+    xmX, xpX = stft.stft_anal(x, w, N, H)
+    assert np.allclose(np.vstack([mX for mX, pX in spectra]), xmX)
+    assert np.allclose(np.vstack([pX for mX, pX in spectra]), xpX)
+    with pytest.raises(ValueError):
+        stream.push(x)
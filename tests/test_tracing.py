@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy.signal import get_window
+
+from eflute.sms_tools.models import harmonicModel, hpsModel, sprModel, stft, tracing
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+
+def test_tracer_reports_stages(sound):
+    x = sound(harmonics=5, noise=0)
+    w = get_window("blackman", 1201)
+    reports = []
+    with tracing.Tracer(reports.append) as tracer:
+        assert tracing.active() is tracer
+        result = harmonicModel.harmonic_model_anal(x, 44100, w, 2048, 256, -80, 10, 100, 1000, 5)
+    assert tracing.active() is None
+    report = reports[0]
+    nFrames = result[0].shape[0]
+    for stage in ["harmonic_model_anal", "dft_anal", "peakDetection", "peakInterp", "f0Twm", "harmonic_detection"]:
+        assert report["stages"][stage]["time"] > 0
+    assert report["stages"]["dft_anal"]["calls"] == -(-nFrames // stft.FRAME_BLOCK)  # frames analyzed in blocks
+    model = report["models"]["harmonic_model_anal"]
+    assert model["frames"] == nFrames
+    assert model["frames_per_second"] > 0
+    assert model["peaks_per_frame"] >= 5
+    for a, b in zip(result, harmonicModel.harmonic_model_anal(x, 44100, w, 2048, 256, -80, 10, 100, 1000, 5)):
+        assert np.array_equal(a, b)
+
+
+def test_tracer_nested_models(sound):
+    x = sound(harmonics=5, noise=0)
+    w = get_window("blackman", 1201)
+    with tracing.Tracer() as tracer:
+        hpsModel.hps_model_anal(x, 44100, w, 2048, 128, -80, 10, 100, 1000, 5, 0.01, 0.02, 512, 0.2)
+    stages = tracer.report()["stages"]
+    for stage in ["hps_model_anal", "harmonic_model_anal", "sineSubtraction", "stochastic_model_anal", "fft"]:
+        assert stages[stage]["calls"] >= 1
+
+
+def test_tracer_spr_model_anal(sound):
+    x = sound(harmonics=5, noise=0)
+    w = get_window("blackman", 1201)
+    with tracing.Tracer() as tracer:
+        sprModel.spr_model_anal(x, 44100, w, 2048, 256, -80, 0.02, 20, 20, 0.01)
+    stages = tracer.report()["stages"]
+    for stage in ["spr_model_anal", "sine_model_anal", "sineSubtraction"]:
+        assert stages[stage]["calls"] == 1
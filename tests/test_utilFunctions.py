@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from eflute.sms_tools.models import sineModel, utilFunctions
+
+__author__ = "Nils"
+__copyright__ = "Nils"
+__license__ = "none"
+
+BACKENDS = ["numpy"] + (["C"] if utilFunctions.UF_C is not None else [])
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = utilFunctions.backend()
+    utilFunctions.setBackend(request.param)
+    yield request.param
+    utilFunctions.setBackend(previous)
+
+
+def test_wavfile_chunks(tmpdir):
+    filename = str(tmpdir.join("stereo.wav"))
+    x = np.random.RandomState(0).randint(-2 ** 15, 2 ** 15, size=(10000, 2)).astype(np.int16)
+    wavfile.write(filename, 22050, x)
+    wav = utilFunctions.WavFile(filename)
+    assert (wav.fs, wav.nchannels, len(wav)) == (22050, 2, 10000)
+    expected = np.float32(x[:, 1]) / utilFunctions.INT16_FAC
+    assert np.array_equal(np.concatenate(list(wav.chunks(3000, channel=1))), expected)
+    assert np.array_equal(wav[100:200, 1], expected[100:200])
+    with pytest.raises(ValueError):
+        utilFunctions.wavread(filename)
+
+
+def test_wavread(tmpdir):
+    filename = str(tmpdir.join("mono.wav"))
+    x = np.random.RandomState(0).randint(-2 ** 15, 2 ** 15, size=1000).astype(np.int16)
+    wavfile.write(filename, 44100, x)
+    fs, y = utilFunctions.wavread(filename)
+    assert fs == 44100
+    assert y.dtype == np.float32
+    assert np.array_equal(y, np.float32(x) / utilFunctions.INT16_FAC)
+
+
+def test_cleaning_track():
+    track = np.array([1, 1, 0, 2, 2, 2, 0, -1, 3, 3, 3, 3, 0, 4, 4])
+    assert np.array_equal(utilFunctions.cleaningTrack(track, 3), [0, 0, 0, 2, 2, 2, 0, -1, 3, 3, 3, 3, 0, 0, 0])
+    assert np.array_equal(utilFunctions.cleaningTrack(track, 4), [0, 0, 0, 0, 0, 0, 0, -1, 3, 3, 3, 3, 0, 0, 0])
+    assert track[0] == 1
+
+
+def test_cleaning_tracks_in_place():
+    rng = np.random.RandomState(0)
+    tracks = rng.choice([0.0, 100.0], size=(200, 8))
+    expected = np.column_stack([utilFunctions.cleaningTrack(tracks[:, i], 5) for i in range(8)])
+    assert utilFunctions.cleaningTracks(tracks, 5) is tracks
+    assert np.array_equal(tracks, expected)
+
+
+def _tracks(nFrames=300, nTracks=8):
+    rng = np.random.RandomState(0)
+    tfreq = rng.choice([0.0, 100.0, 1000.0], size=(nFrames, nTracks), p=[0.5, 0.25, 0.25]) + rng.rand(nFrames, nTracks)
+    tfreq[tfreq < 1] = 0
+    return tfreq, -20 * rng.rand(nFrames, nTracks), rng.uniform(-np.pi, np.pi, (nFrames, nTracks))
+
+
+def test_sparse_tracks_round_trip():
+    tfreq, tmag, tphase = _tracks()
+    tracks = utilFunctions.SparseTracks.fromDense(tfreq, tmag, tphase)
+    assert tracks.nFrames == 300 and tracks.freq.size == np.count_nonzero(tfreq)
+    active = tfreq > 0
+    for a, b in zip(tracks.toDense(), (tfreq, tmag * active, tphase * active)):
+        assert np.array_equal(a, b)
+    tracks32 = utilFunctions.SparseTracks.fromDense(tfreq, tmag, np.array([]), np.float32)
+    assert tracks32.phase is None and tracks32.freq.dtype == np.float32
+    assert tracks32.nbytes < tracks.nbytes
+    assert tracks32.toDense()[2].size == 0
+    frame, track, freq, mag, phase = tracks.frames(10, 12)
+    assert np.array_equal(freq, tfreq[10:12][active[10:12]])
+    assert np.array_equal(frame, np.nonzero(active[10:12])[0])
+
+
+@pytest.mark.parametrize("minTrackLength", [0, 1, 3, 6])
+def test_sparse_tracks_clean(minTrackLength):
+    tfreq, tmag, tphase = _tracks()
+    tracks = utilFunctions.SparseTracks.fromDense(tfreq, tmag, tphase)
+    assert tracks.clean(minTrackLength) is tracks
+    expected = utilFunctions.cleaningTracks(tfreq, minTrackLength)
+    assert np.array_equal(tracks.toDense()[0], expected)
+    assert np.array_equal(tracks.toDense()[1], tmag * (expected > 0))
+
+
+def _spectra():
+    rng = np.random.RandomState(0)
+    return -60 + 20 * rng.randn(50, 257), np.cumsum(rng.randn(50, 257), axis=1)
+
+
+def test_peak_detection_frames():
+    mX, pX = _spectra()
+    ploc, offsets = utilFunctions.peakDetectionFrames(mX, -60)
+    iploc, ipmag, ipphase = utilFunctions.peakInterpFrames(mX, pX, ploc, offsets)
+    assert offsets.size == 51
+    for l in range(50):
+        expected = utilFunctions.peakDetection(mX[l], -60)
+        assert np.array_equal(ploc[offsets[l]:offsets[l + 1]], expected)
+        for a, b in zip((iploc, ipmag, ipphase), utilFunctions.peakInterp(mX[l], pX[l], expected)):
+            assert np.allclose(a[offsets[l]:offsets[l + 1]], b, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("maxnPeaks", [0, 1, 5, 100])
+def test_peak_detection_frames_strongest(maxnPeaks):
+    mX, pX = _spectra()
+    ploc, offsets = utilFunctions.peakDetectionFrames(mX, -60, maxnPeaks)
+    for l in range(50):
+        expected = utilFunctions.peakDetection(mX[l], -60)
+        expected = np.sort(expected[np.argsort(-mX[l, expected])[:maxnPeaks]])
+        assert np.array_equal(ploc[offsets[l]:offsets[l + 1]], expected)
+
+
+def test_bh_lobe_table():
+    x = np.linspace(-4.5, 4.5, 1001) + 1e-7
+    assert np.allclose(utilFunctions.bhLobe(x), utilFunctions.genBhLobe(x), rtol=0, atol=1e-6)
+
+
+def _gen_spec_sines_frame_by_frame(ipfreq, ipmag, ipphase, N, fs):
+    # loop over every sine and lobe bin, as genSpecSines_p did, with lobes folded at DC and Nyquist
+    Y = np.zeros(N, dtype=complex)
+    hN = N // 2
+    for i in range(ipfreq.size):
+        loc = N * ipfreq[i] / fs
+        if loc <= 0 or loc > hN - 1:
+            continue
+        rloc = int(np.floor(loc + 0.5))
+        lmag = utilFunctions.genBhLobe(np.arange(rloc - loc - 4, rloc - loc + 5)) * 10 ** (ipmag[i] / 20)
+        for m, b in enumerate(range(rloc - 4, rloc + 5)):
+            if b < 0:
+                Y[-b] += lmag[m] * np.exp(-1j * ipphase[i])
+            elif b > hN:
+                Y[N - b] += lmag[m] * np.exp(-1j * ipphase[i])
+            elif b == 0 or b == hN:
+                Y[b] += 2 * lmag[m] * np.cos(ipphase[i])
+            else:
+                Y[b] += lmag[m] * np.exp(1j * ipphase[i])
+    Y[hN + 1:] = Y[hN - 1:0:-1].conjugate()
+    return Y
+
+
+def test_gen_spec_sines_frames(backend):
+    rng = np.random.RandomState(0)
+    N, fs = 512, 44100.0
+    ipfreq = rng.uniform(0, fs / 2, (20, 12))
+    ipfreq[:, :2] = rng.uniform(0, 6 * fs / N, (20, 2))  # lobes crossing DC
+    ipfreq[:, 2:4] = rng.uniform(fs / 2 - 6 * fs / N, fs / 2, (20, 2))  # lobes crossing Nyquist
+    ipfreq[rng.rand(20, 12) < 0.2] = 0
+    ipmag = rng.uniform(-80, 0, (20, 12))
+    ipphase = rng.uniform(-np.pi, np.pi, (20, 12))
+    with np.errstate(invalid="ignore"):
+        Y = utilFunctions.genSpecSinesFrames(ipfreq, ipmag, ipphase, N, fs)
+        for l in range(20):
+            if backend == "C":  # spectra of the C function
+                expected = utilFunctions.UF_C.genSpecSines(N * ipfreq[l] / fs, ipmag[l], ipphase[l], N)
+                assert np.array_equal(Y[l], expected)
+            else:
+                assert np.allclose(Y[l], _gen_spec_sines_frame_by_frame(ipfreq[l], ipmag[l], ipphase[l], N, fs),
+                                   rtol=0, atol=1e-6)
+
+
+def _sinewave_synth_frame_by_frame(freqs, amp, H, fs):
+    t = np.arange(H) / float(fs)
+    lastphase = 0
+    lastfreq = freqs[0]
+    y = []
+    for f in freqs:
+        if lastfreq == 0 and f == 0:
+            A, freq = np.zeros(H), np.zeros(H)
+        elif lastfreq == 0:
+            A, freq = np.arange(H) * amp / H, np.ones(H) * f
+        elif f > 0:
+            A, freq = np.ones(H) * amp, lastfreq + np.arange(H) * (f - lastfreq) / H
+        else:
+            A, freq = amp - np.arange(H) * amp / H, np.ones(H) * lastfreq
+        phase = 2 * np.pi * freq * t + lastphase
+        y.append(A * np.cos(phase))
+        lastfreq = f
+        lastphase = np.remainder(phase[H - 1], 2 * np.pi)
+    return np.concatenate(y)
+
+
+def test_sinewave_synth():
+    freqs = np.array([0, 0, 440, 440, 450, 460, 0, 0, 300, 300, 0], dtype=float)
+    y = utilFunctions.sinewaveSynth(freqs, 0.8, 128, 44100)
+    assert y.size == freqs.size * 128
+    assert np.allclose(y, _sinewave_synth_frame_by_frame(freqs, 0.8, 128, 44100), rtol=0, atol=1e-10)
+
+
+def _harmonic_peaks(nFrames=400):
+    rng = np.random.RandomState(0)
+    pfreq, pmag, counts = [], [], []
+    for l in range(nFrames):
+        f0 = 200 + 100 * np.sin(l / 30.0) if rng.rand() < 0.8 else 0  # harmonic frames and noise frames
+        freq = np.concatenate((f0 * np.arange(1, rng.randint(1, 15)) * (1 + 0.01 * rng.randn()),
+                               rng.uniform(50, 5000, rng.randint(0, 8))))
+        freq = np.unique(freq[freq > 0])
+        pfreq.append(freq)
+        pmag.append(-20 - 40 * rng.rand(freq.size))
+        counts.append(freq.size)
+    return np.concatenate(pfreq), np.concatenate(pmag), np.concatenate(([0], np.cumsum(counts)))
+
+
+@pytest.mark.skipif(utilFunctions.UF_C is None, reason="utilFunctions_C is not compiled")
+def test_twm_errors():
+    pfreq, pmag, offsets = _harmonic_peaks(50)
+    cand = np.nonzero((pfreq > 100) & (pfreq < 1000))[0]
+    frame = np.searchsorted(offsets, cand, side="right") - 1
+    error = utilFunctions.twmErrors(pfreq, pmag, offsets, pfreq[cand], frame)
+    for c, l, e in zip(cand, frame, error):
+        b, e2 = offsets[l], offsets[l + 1]
+        assert e == utilFunctions.UF_C.twm(pfreq[b:e2], pmag[b:e2], pfreq[c:c + 1])[1]
+    f0c = np.array([430.0, 215.0, 99.5])
+    rng = np.random.RandomState(1)
+    pf = rng.permutation(pfreq[offsets[3]:offsets[4]])  # any peak order
+    assert utilFunctions.TWM_p(pf, pmag[:pf.size], f0c) == utilFunctions.UF_C.twm(pf, pmag[:pf.size], f0c)
+    pf[2::3] = pf[1::3][:pf[2::3].size]  # duplicate peak frequencies
+    assert utilFunctions.TWM_p(pf, pmag[:pf.size], f0c) == utilFunctions.UF_C.twm(pf, pmag[:pf.size], f0c)
+
+
+def test_nearest_peaks_duplicates():
+    rng = np.random.RandomState(0)
+    pfreq = np.round(rng.uniform(0, 20, 60))  # many peaks with the same frequency, in any order
+    offsets = np.array([0, 25, 25, 60])
+    frame = np.array([0, 1, 2])
+    freq = rng.uniform(-2, 22, (3, 40))
+    peak = utilFunctions.nearestPeaks(pfreq, offsets, frame, freq)
+    assert np.all(peak[1] == -1)
+    for l in (0, 2):
+        b, e = offsets[l], offsets[l + 1]
+        expected = [b + np.argmin(np.abs(pfreq[b:e] - f)) for f in freq[l]]  # first of the nearest peaks
+        assert np.array_equal(peak[l], expected)
+
+
+def test_f0_twm_frames(backend):
+    pfreq, pmag, offsets = _harmonic_peaks()
+    f0 = utilFunctions.f0TwmFrames(pfreq, pmag, offsets, 5, 100, 1000)
+    expected = []
+    f0stable = 0
+    for b, e in zip(offsets[:-1], offsets[1:]):
+        f0t = utilFunctions.f0Twm(pfreq[b:e], pmag[b:e], 5, 100, 1000, f0stable)
+        if ((f0stable == 0) & (f0t > 0)) or ((f0stable > 0) & (np.abs(f0stable - f0t) < f0stable / 5.0)):
+            f0stable = f0t
+        else:
+            f0stable = 0
+        expected.append(f0t)
+    assert np.count_nonzero(f0) > 100
+    assert np.array_equal(f0, expected)
+
+
+def test_backend():
+    assert utilFunctions.backend() == ("C" if utilFunctions.UF_C is not None else "numpy")
+    with pytest.raises(ValueError):
+        utilFunctions.setBackend("fortran")
+    previous = utilFunctions.backend()
+    rng = np.random.RandomState(0)
+    ipfreq, ipmag, ipphase = rng.uniform(50, 20000, 10), rng.uniform(-60, 0, 10), rng.uniform(-np.pi, np.pi, 10)
+    Y = utilFunctions.genSpecSines(ipfreq, ipmag, ipphase, 1024, 44100)
+    try:
+        utilFunctions.setBackend("numpy")
+        assert utilFunctions.backend() == "numpy"
+        Yp = utilFunctions.genSpecSines(ipfreq, ipmag, ipphase, 1024, 44100)
+        assert np.array_equal(Yp, utilFunctions.genSpecSines_p(ipfreq, ipmag, ipphase, 1024, 44100))
+        assert np.abs(Yp - Y).max() < 0.15 * 10 ** (ipmag.max() / 20)
+        tracks = [np.tile(values[:5], (20, 1)) for values in (ipfreq, ipmag, ipphase)]
+        y = sineModel.sine_model_synth(*(tracks + [512, 128, 44100]))
+        utilFunctions.setBackend(previous)  # the models use the selected backend
+        yb = sineModel.sine_model_synth(*(tracks + [512, 128, 44100]))
+        assert np.array_equal(y, yb) == (previous == "numpy")
+    finally:
+        utilFunctions.setBackend(previous)